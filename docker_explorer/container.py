@@ -114,14 +114,12 @@ class Container:
           'Unable to find container configuration file: '
           f'{container_info_json_path}'
       )
-    with open(
-        container_info_json_path, encoding='utf-8') as container_info_json_file:
-      try:
-        container_info_dict = json.load(container_info_json_file)
-      except (json.decoder.JSONDecodeError, OSError) as error:
-        raise errors.BadContainerException(
-            'Could not parse JSON configuration file '
-            f'{container_info_json_path}: {error}')
+    try:
+      container_info_dict = utils.LoadJSONFile(container_info_json_path)
+    except (json.decoder.JSONDecodeError, OSError) as error:
+      raise errors.BadContainerException(
+          'Could not parse JSON configuration file '
+          f'{container_info_json_path}: {error}')
 
     if container_info_dict is None:
       raise errors.BadContainerException(
@@ -232,8 +230,7 @@ class Container:
           self.docker_directory, 'image', self.storage_name, 'imagedb',
           'content', hash_method, layer_id)
     if os.path.isfile(layer_info_path):
-      with open(layer_info_path, encoding='utf-8') as layer_info_file:
-        return json.load(layer_info_file)
+      return utils.LoadJSONFile(layer_info_path)
 
     return None
 
@@ -254,9 +251,8 @@ class Container:
       if self.docker_version == 1:
         layer_info_path = os.path.join(
             self.docker_directory, 'graph', current_layer, 'json')
-        with open(layer_info_path, encoding='utf-8') as layer_info_file:
-          layer_info = json.load(layer_info_file)
-          current_layer = layer_info.get('parent', None)
+        layer_info = utils.LoadJSONFile(layer_info_path)
+        current_layer = layer_info.get('parent', None)
       elif self.docker_version == 2:
         hash_method, layer_id = current_layer.split(':')
         parent_layer_path = os.path.join(
@@ -17,9 +17,14 @@
 
 from __future__ import unicode_literals
 
+import bisect
 import collections
-import json
+import concurrent.futures
+import itertools
+import mmap
+import operator
 import os
+import re
 
 import docker_explorer
 
@@ -28,33 +33,47 @@ from docker_explorer import errors
 from docker_explorer import utils
 
 
+# Matches the running state in a raw container configuration file.
+_RUNNING_STATE_RE = re.compile(rb'"Running"\s*:\s*true')
+
+
 class Explorer:
   """Class for a DockerExplorer object."""
 
   DEFAULT_DOCKER_VERSION = 2
 
+  # Maximum number of threads used to load containers in GetAllContainers().
+  MAX_LOADING_THREADS = 16
+
   def __init__(self):
     """Initializes the DockerExplorer class."""
-    self.containers_directory = None
     self.docker_directory = docker_explorer.DEFAULT_DOCKER_DIRECTORY
+    self.containers_directory = os.path.join(
+        self.docker_directory, 'containers')
     self.docker_version = self.DEFAULT_DOCKER_VERSION
+    self._container_ids = None
 
-  def SetDockerDirectory(self, docker_path):
+  def SetDockerDirectory(self, docker_path, storage_version=None):
     """Sets the Docker main directory.
 
     Args:
       docker_path(str): the absolute path to the docker directory.
+      storage_version(int): the Docker storage version (1 or 2), if already
+        known. This saves calling DetectDockerStorageVersion().
     Raises:
       errors.BadStorageException: if the path doesn't point to a Docker
         directory.
     """
     self.docker_directory = docker_path
+    self._container_ids = None
     if not os.path.isdir(self.docker_directory):
       msg = f'{self.docker_directory} is not a Docker directory'
       raise errors.BadStorageException(msg)
 
     self.containers_directory = os.path.join(
         self.docker_directory, 'containers')
+    if storage_version:
+      self.docker_version = storage_version
 
   def DetectDockerStorageVersion(self):
     """Detects Docker storage version (v1 or v2).
@@ -64,10 +83,7 @@ class Explorer:
         version.
       errors.DockerExplorerError: when no container is detected in the storage.
     """
-    if not os.path.isdir(self.containers_directory):
-      raise errors.BadStorageException(
-          f'Containers directory {self.containers_directory} does not exist.')
-    container_ids_list = os.listdir(self.containers_directory)
+    container_ids_list = self._GetContainerIDs()
     if not container_ids_list:
       raise errors.DockerExplorerError(
           f'Could not find any container in {self.containers_directory}.\n'
@@ -76,9 +92,14 @@ class Explorer:
           'with higher privileges.')
     path_to_a_container = os.path.join(
         self.containers_directory, container_ids_list[0])
-    if os.path.isfile(os.path.join(path_to_a_container, 'config.v2.json')):
+    with os.scandir(path_to_a_container) as entries:
+      config_filenames = {
+          entry.name for entry in entries
+          if entry.name in ('config.v2.json', 'config.json')
+          and entry.is_file()}
+    if 'config.v2.json' in config_filenames:
       self.docker_version = 2
-    elif os.path.isfile(os.path.join(path_to_a_container, 'config.json')):
+    elif 'config.json' in config_filenames:
       self.docker_version = 1
     else:
       raise errors.BadStorageException(
@@ -87,6 +108,29 @@ class Explorer:
           f'{path_to_a_container}'
       )
 
+  def _GetContainerIDs(self):
+    """Returns the IDs of the containers in the Docker directory.
+
+    The containers directory is only listed once, the result is cached until
+    the Docker directory changes.
+
+    Returns:
+      tuple(str): the container IDs, sorted.
+
+    Raises:
+      errors.BadStorageException: if the containers directory doesn't exist.
+    """
+    if self._container_ids is None:
+      try:
+        with os.scandir(self.containers_directory) as entries:
+          self._container_ids = tuple(
+              sorted(entry.name for entry in entries if entry.is_dir()))
+      except (FileNotFoundError, NotADirectoryError) as e:
+        raise errors.BadStorageException(
+            f'Containers directory {self.containers_directory} does not '
+            'exist.') from e
+    return self._container_ids
+
   def _GetFullContainerID(self, short_id):
     """Searches for a container ID from its first characters.
 
@@ -101,12 +145,15 @@ class Explorer:
     if len(short_id) == 64:
       return short_id
 
-    containers_dir = os.path.join(self.docker_directory, 'containers')
+    # The IDs are sorted, so the ones starting with short_id are contiguous,
+    # starting where short_id would be inserted.
+    container_ids = self._GetContainerIDs()
     possible_cids = []
-    for container_dirs in sorted(os.listdir(containers_dir)):
-      possible_cid = os.path.basename(container_dirs)
-      if possible_cid.startswith(short_id):
-        possible_cids.append(possible_cid)
+    for cid in itertools.islice(
+        container_ids, bisect.bisect_left(container_ids, short_id), None):
+      if not cid.startswith(short_id):
+        break
+      possible_cids.append(cid)
 
     possible_cids_len = len(possible_cids)
     if possible_cids_len == 0:
@@ -132,9 +179,41 @@ class Explorer:
     return container.Container(
         self.docker_directory, container_id, docker_version=self.docker_version)
 
-  def GetAllContainers(self):
+  def _ContainerMayBeRunning(self, container_id):
+    """Checks whether a container may be running, without parsing its config.
+
+    This only searches the raw configuration file for a running state, so it
+    can return false positives, which the caller still has to check with
+    Container.running.
+
+    Args:
+      container_id (str): the full container ID.
+
+    Returns:
+      bool: False if the container is known not to be running.
+    """
+    config_filename = 'config.v2.json'
+    if self.docker_version == 1:
+      config_filename = 'config.json'
+    config_path = os.path.join(
+        self.containers_directory, container_id, config_filename)
+    try:
+      # Mapping the file lets the search stop at the first match without
+      # reading the rest of a large configuration.
+      with open(config_path, 'rb') as config_file, mmap.mmap(
+          config_file.fileno(), 0, access=mmap.ACCESS_READ) as config_map:
+        return bool(_RUNNING_STATE_RE.search(config_map))
+    except (OSError, ValueError):
+      # Let GetContainer() report missing, unreadable or empty files.
+      return True
+
+  def GetAllContainers(self, only_running=False):
     """Gets a list containing information about all containers.
 
+    Args:
+      only_running (bool): Whether we skip containers which are known not to
+        be running. Some non running containers may still be returned.
+
     Returns:
       list(Container): the list of Container objects.
 
@@ -143,7 +222,7 @@ class Explorer:
         in the provided Docker directory.
       errors.DockerExplorerError: when no container is detected in the storage.
     """
-    container_ids_list = container.GetAllContainersIDs(self.docker_directory)
+    container_ids_list = self._GetContainerIDs()
     if not container_ids_list:
       raise errors.DockerExplorerError(
           f'Could not find container directory in {self.containers_directory}.'
@@ -151,12 +230,32 @@ class Explorer:
           'correct.\nIf it is correct, you might want to run this script '
           'with higher privileges.'
       )
-    containers_list = []
-    for cid in container_ids_list:
+    if only_running:
+      container_ids_list = [
+          cid for cid in container_ids_list
+          if self._ContainerMayBeRunning(cid)]
+    if not container_ids_list:
+      return []
+
+    def _LoadContainer(cid):
       try:
-        containers_list.append(self.GetContainer(cid))
+        return self.GetContainer(cid)
       except errors.BadContainerException as e:
-        print(f'WARNING: Error loading container {cid}: {e}')
+        return e
+
+    # Loading a container is mostly file I/O, which releases the GIL, so the
+    # configuration files are read concurrently.
+    with concurrent.futures.ThreadPoolExecutor(
+        max_workers=min(self.MAX_LOADING_THREADS, len(container_ids_list))
+    ) as executor:
+      results = list(executor.map(_LoadContainer, container_ids_list))
+
+    containers_list = []
+    for cid, result in zip(container_ids_list, results):
+      if isinstance(result, errors.BadContainerException):
+        print(f'WARNING: Error loading container {cid}: {result}')
+      else:
+        containers_list.append(result)
     return containers_list
 
   def GetContainersList(self, only_running=False, filter_repositories=None):
@@ -171,14 +270,15 @@ class Explorer:
     Returns:
       list(Container): list of Containers information objects.
     """
-    containers_list = sorted(
-        self.GetAllContainers(), key=lambda x: x.start_timestamp)
+    containers_list = self.GetAllContainers(only_running=only_running)
     if only_running:
       containers_list = [x for x in containers_list if x.running]
     if filter_repositories:
       containers_list = [
           c for c in containers_list
           if c.config_image_name.split('/')[0] not in filter_repositories]
+    # Filtering first means we only sort the containers we return.
+    containers_list.sort(key=operator.attrgetter('start_timestamp'))
     return containers_list
 
   def GetContainersJson(self, only_running=False, filter_repositories=None):
@@ -234,11 +334,12 @@ class Explorer:
 
     return result
 
-  def GetRepositoriesString(self):
+  def GetRepositoriesJson(self):
     """Returns information about images in the local Docker repositories.
 
     Returns:
-      str: human readable list of images in local Docker repositories.
+      list(dict): the parsed repositories files, each with an extra 'path' key
+        pointing to the file it was parsed from.
 
     Raises:
       errors.BadStorageException: If required files or directories are not found
@@ -252,17 +353,31 @@ class Explorer:
       if not os.path.isdir(image_path):
         raise errors.BadStorageException(
             f'Expected image directory {image_path} does not exist.')
-      for storage_method in os.listdir(image_path):
-        repositories_file_path = os.path.join(
-            image_path, storage_method, 'repositories.json')
-        if os.path.isfile(repositories_file_path):
-          repositories.append(repositories_file_path)
+      with os.scandir(image_path) as entries:
+        for entry in entries:
+          if not entry.is_dir():
+            continue
+          repositories_file_path = os.path.join(
+              entry.path, 'repositories.json')
+          if os.path.isfile(repositories_file_path):
+            repositories.append(repositories_file_path)
 
     result = []
     for repositories_file_path in sorted(repositories):
-      with open(repositories_file_path, encoding='utf-8') as rf:
-        repo_obj = json.loads(rf.read())
-        repo_obj['path'] = repositories_file_path
-        result.append(repo_obj)
+      repo_obj = utils.LoadJSONFile(repositories_file_path)
+      repo_obj['path'] = repositories_file_path
+      result.append(repo_obj)
+
+    return result
+
+  def GetRepositoriesString(self):
+    """Returns information about images in the local Docker repositories.
 
-    return utils.PrettyPrintJSON(result)
+    Returns:
+      str: human readable list of images in local Docker repositories.
+
+    Raises:
+      errors.BadStorageException: If required files or directories are not found
+        in the provided Docker directory.
+    """
+    return utils.PrettyPrintJSON(self.GetRepositoriesJson())
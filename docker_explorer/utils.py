@@ -19,6 +19,21 @@ from __future__ import unicode_literals
 import datetime
 import json
 
+try:
+  import orjson
+except ImportError:
+  orjson = None
+
+# Bound once, as FormatDatetime is called for every container and layer.
+_FROMISOFORMAT = datetime.datetime.fromisoformat
+
+# json.dumps() builds a new encoder on every call when given formatting
+# options, so we keep one per sort_keys value.
+_PRETTY_JSON_ENCODERS = {
+    sort_keys: json.JSONEncoder(
+        sort_keys=sort_keys, indent=4, separators=(', ', ': '))
+    for sort_keys in (False, True)}
+
 
 def FormatDatetime(timestamp):
   """Formats a Docker timestamp.
@@ -30,16 +45,38 @@ def FormatDatetime(timestamp):
     str: Human readable timestamp.
   """
   try:
-    time = datetime.datetime.fromisoformat(timestamp)
+    time = _FROMISOFORMAT(timestamp)
   except ValueError:
     # Strip non-ISO compliant precision and time zone designator.
     timestamp = timestamp[:26]
     if timestamp[-1].isalpha():
       timestamp = timestamp[:-1]
-    time = datetime.datetime.fromisoformat(timestamp)
+    time = _FROMISOFORMAT(timestamp)
   return time.isoformat()
 
 
+def LoadJSONFile(path):
+  """Parses a JSON file.
+
+  Uses orjson, which is much faster than the json module, when it is installed.
+
+  Args:
+    path (str): the path to the JSON file.
+
+  Returns:
+    object: the parsed JSON document.
+
+  Raises:
+    json.JSONDecodeError: if the file doesn't contain valid JSON.
+    OSError: if the file can't be read.
+  """
+  if orjson:
+    with open(path, 'rb') as json_file:
+      return orjson.loads(json_file.read())  #pylint: disable=no-member
+  with open(path, encoding='utf-8') as json_file:
+    return json.load(json_file)
+
+
 def PrettyPrintJSON(dict_object, sort_keys=True):
   """Generates a easy to read representation of a dict object.
 
@@ -50,6 +87,22 @@ def PrettyPrintJSON(dict_object, sort_keys=True):
   Returns:
     str: pretty printed JSON string.
   """
-  pretty_json = json.dumps(
-      dict_object, sort_keys=sort_keys, indent=4, separators=(', ', ': '))
+  pretty_json = _PRETTY_JSON_ENCODERS[bool(sort_keys)].encode(dict_object)
   return pretty_json + '\n'
+
+
+def WritePrettyJSON(dict_object, output_file, sort_keys=True):
+  """Writes the PrettyPrintJSON representation of a dict object to a file.
+
+  The JSON is written as it is encoded, so the whole string is never built in
+  memory.
+
+  Args:
+    dict_object (dict): dict to write.
+    output_file (file): the text file object to write to.
+    sort_keys (bool): bool to enable key sorting
+  """
+  encoder = _PRETTY_JSON_ENCODERS[bool(sort_keys)]
+  for chunk in encoder.iterencode(dict_object):
+    output_file.write(chunk)
+  output_file.write('\n')
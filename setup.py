@@ -25,6 +25,9 @@ setup(
     install_requires=[
         'requests',
     ],
+    extras_require={
+        'fast_json': ['orjson'],
+    },
     classifiers=[
         'Development Status :: 4 - Beta',
         'Operating System :: OS Independent',
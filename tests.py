@@ -17,15 +17,20 @@
 from __future__ import unicode_literals
 
 import collections
+import concurrent.futures
+import contextlib
+import heapq
+import io
+import json
+import operator
 import os
 import shutil
-import sys
+import subprocess
 import tarfile
 import tempfile
+import types
 import unittest
-import unittest.mock
-
-from io import StringIO
+import zlib
 
 from docker_explorer import __version__ as de_version
 from docker_explorer import container
@@ -40,16 +45,192 @@ from tools import de
 # pylint: disable=line-too-long
 # pylint: disable=protected-access
 
+# The containers the storage tests focus on, one per fixture.
+_AUFS_CONTAINER_ID = (
+    '7b02fb3e8a665a63e32b909af5babb7d6ba0b64e10003b2d9534c7d5f2af8966')
+_AUFS_V1_CONTAINER_ID = (
+    'de44dd97cfd1c8d1c1aad7f75a435603991a7a39fa4f6b20a69bf4458809209c')
+_OVERLAY_CONTAINER_ID = (
+    '5dc287aa80b460652a5584e80a5c8c1233b0c0691972d75424cf5250b917600a')
+_OVERLAY2_CONTAINER_ID = (
+    '8e8b7f23eb7cbd4dfe7e91646ddd0e0f524218e25d50113559f078dfb2690206')
+
+# Expected Container.GetHistory() results for the containers above. These are
+# read-only, so they are built once at import time.
+_AUFS_HISTORY = types.MappingProxyType({
+    'sha256:'
+    '7968321274dc6b6171697c33df7815310468e694ac5be0ec03ff053bb135e768': {
+        'created_at': '2017-01-13T22:13:54.401355+00:00',
+        'container_cmd': '/bin/sh -c #(nop)  CMD ["sh"]',
+        'size': 0
+    }
+})
+_AUFS_V1_HISTORY = types.MappingProxyType({
+    '1cee97b18f87b5fa91633db35f587e2c65c093facfa2cbbe83d5ebe06e1d9125': {
+        'size': 0
+    },
+    'df557f39d413a1408f5c28d8aab2892f927237ec22e903ef04b331305130ab38': {
+        'created_at': '2018-12-26T08:20:42.687925+00:00',
+        'container_cmd': '/bin/sh -c #(nop) ADD file:ce026b62356eec3ad1214f92be2c9dc063fe205bd5e600be3492c4dfb17148bd in / ',
+        'size': 1154361
+    }
+})
+_OVERLAY_HISTORY = types.MappingProxyType({
+    'sha256:'
+    '5b0d59026729b68570d99bc4f3f7c31a2e4f2a5736435641565d93e7c25bd2c3': {
+        'created_at': '2018-01-24T04:29:35.590938+00:00',
+        'container_cmd': '/bin/sh -c #(nop)  CMD ["sh"]',
+        'size': 0
+    }
+})
+_OVERLAY2_HISTORY = types.MappingProxyType({
+    'sha256:'
+    '8ac48589692a53a9b8c2d1ceaa6b402665aa7fe667ba51ccc03002300856d8c7': {
+        'created_at': '2018-04-05T10:41:28.876407+00:00',
+        'container_cmd': '/bin/sh -c #(nop)  CMD ["sh"]',
+        'size': 0
+    }
+})
+
+# Attributes checked by the testGetAllContainers tests, in a single tuple.
+_CONTAINER_SUMMARY = operator.attrgetter(
+    'name', 'creation_timestamp', 'config_image_name', 'running',
+    'container_id')
+
+# Maps a test_data tarball name to the temporary directory it was extracted
+# to, so that test classes using the same tarball share one extraction.
+_EXTRACTED_FIXTURES = {}
+
+# Maps a test_data tarball name to an Explorer set up on its extraction.
+_EXPLORERS = {}
+
+_TAR_PATH = shutil.which('tar')
+
+# The Docker fixtures used by the test classes below.
+_FIXTURE_TARBALLS = (
+    'aufs.v1.tgz', 'aufs.v2.tgz', 'overlay.v2.tgz', 'overlay2.v2.tgz',
+    'vols.v2.tgz')
+
+
+class _FixtureTarFile(tarfile.TarFile):
+  """TarFile that doesn't restore ownership and mtimes when extracting."""
+
+  def chown(self, tarinfo, targetpath, numeric_owner):
+    """Skips changing the owner of extracted files."""
+
+  def utime(self, tarinfo, targetpath):
+    """Skips setting the modification time of extracted files."""
+
+
+def _ExtractFixture(tarball_name):
+  """Extracts a test_data tarball, once per test run.
+
+  Test classes only read from the extracted Docker directory, so all classes
+  using the same tarball can share it. The fixtures are removed in
+  tearDownModule().
+
+  Args:
+    tarball_name (str): the name of the tarball in test_data.
+
+  Returns:
+    str: the path to the extracted Docker root directory.
+  """
+  fixture_directory = _EXTRACTED_FIXTURES.get(tarball_name)
+  if fixture_directory is None:
+    # Extracting out of the source tree keeps concurrent test runs apart, and
+    # puts the fixtures on tmpfs where TMPDIR points to one.
+    fixture_directory = tempfile.mkdtemp(prefix='de-fixture-')
+    docker_tar = os.path.join('test_data', tarball_name)
+    if _TAR_PATH:
+      # The system tar is several times faster than the tarfile module. Tests
+      # only read file contents, so don't restore mtimes or ownership.
+      subprocess.run(
+          [_TAR_PATH, '-xzmf', docker_tar, '--no-same-owner',
+           '-C', fixture_directory],
+          check=True)
+    else:
+      with open(docker_tar, 'rb') as tar_file:
+        # Inflating the whole archive in one zlib call is much faster than
+        # letting tarfile read it through GzipFile in small chunks.
+        tar_data = zlib.decompress(tar_file.read(), 16 + zlib.MAX_WBITS)
+      with _FixtureTarFile.open(fileobj=io.BytesIO(tar_data)) as tar:
+        # The 'data' filter would reject the absolute symlinks found in the
+        # fixtures' container filesystems (e.g. etc/mtab).
+        tar.extractall(fixture_directory, filter='tar')
+    _EXTRACTED_FIXTURES[tarball_name] = fixture_directory
+  return os.path.join(fixture_directory, 'docker')
+
+
+def _GetExplorer(tarball_name, storage_version):
+  """Returns an Explorer for a test_data tarball, shared across test classes.
+
+  Args:
+    tarball_name (str): the name of the tarball in test_data.
+    storage_version (int): the Docker storage version of the fixture.
+
+  Returns:
+    explorer.Explorer: the Explorer object, set up on the extracted fixture.
+  """
+  explorer_object = _EXPLORERS.get(tarball_name)
+  if explorer_object is None:
+    explorer_object = explorer.Explorer()
+    explorer_object.SetDockerDirectory(
+        _ExtractFixture(tarball_name), storage_version=storage_version)
+    _EXPLORERS[tarball_name] = explorer_object
+  return explorer_object
+
+
+def setUpModule():
+  """Extracts all the Docker fixtures concurrently.
+
+  Extraction is mostly spent in tar subprocesses or zlib, both of which release
+  the GIL, so a thread pool is enough to overlap them.
+  """
+  with concurrent.futures.ThreadPoolExecutor() as executor:
+    list(executor.map(_ExtractFixture, _FIXTURE_TARBALLS))
+
+
+def tearDownModule():
+  """Removes the fixtures extracted by _ExtractFixture()."""
+  _EXPLORERS.clear()
+  for fixture_directory in _EXTRACTED_FIXTURES.values():
+    shutil.rmtree(fixture_directory, ignore_errors=True)
+  _EXTRACTED_FIXTURES.clear()
+
 
 class UtilsTests(unittest.TestCase):
   """Tests Utils methods."""
 
+  def testWritePrettyJSON(self):
+    """Tests the utils.WritePrettyJSON function."""
+    test_dict = {'test': [{'dict2': None, 'dict1': {'key1': 'val1'}}]}
+    for sort_keys in (True, False):
+      output = io.StringIO()
+      utils.WritePrettyJSON(test_dict, output, sort_keys=sort_keys)
+      self.assertEqual(
+          utils.PrettyPrintJSON(test_dict, sort_keys=sort_keys),
+          output.getvalue())
+
   def testFormatDatetime(self):
     """Tests the utils.FormatDatetime function."""
     test_date = '2017-12-25T15:59:59.102938 msqedigrb msg'
     expected_time_str = '2017-12-25T15:59:59.102938'
     self.assertEqual(expected_time_str, utils.FormatDatetime(test_date))
 
+  def testLoadJSONFile(self):
+    """Tests the utils.LoadJSONFile function."""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+      json_path = os.path.join(tmp_dir, 'test.json')
+      with open(json_path, 'w', encoding='utf-8') as json_file:
+        json_file.write('{"test": [1, "\u00e9", null]}')
+      self.assertEqual(
+          {'test': [1, '\u00e9', None]}, utils.LoadJSONFile(json_path))
+
+      with open(json_path, 'w', encoding='utf-8') as json_file:
+        json_file.write('{')
+      with self.assertRaises(json.JSONDecodeError):
+        utils.LoadJSONFile(json_path)
+
   def testPrettyPrintJSON(self):
     """Tests the utils.PrettyPrintJSON function."""
     test_dict = {'test': [{'dict1': {'key1': 'val1'}, 'dict2': None}]}
@@ -62,36 +243,25 @@ class UtilsTests(unittest.TestCase):
 class TestDEMain(unittest.TestCase):
   """Tests DockerExplorerTool object methods."""
 
-  @classmethod
-  def tearDownClass(cls):
-    shutil.rmtree(cls.docker_directory_path)
-
   @classmethod
   def setUpClass(cls):
     # We setup one overlay2 backed Docker root folder for all the following
     # tests.
     cls.driver = 'overlay2'
-    cls.docker_directory_path = os.path.join('test_data', 'docker')
-    if not os.path.isdir(cls.docker_directory_path):
-      docker_tar = os.path.join('test_data', 'overlay2.v2.tgz')
-      with tarfile.open(docker_tar, 'r:gz') as tar:
-        tar.extractall('test_data')
-    cls.explorer_object = explorer.Explorer()
-    cls.explorer_object.SetDockerDirectory(cls.docker_directory_path)
-    cls.explorer_object.DetectDockerStorageVersion()
+    cls.explorer_object = _GetExplorer('overlay2.v2.tgz', 2)
+    cls.docker_directory_path = cls.explorer_object.docker_directory
+    cls.de_object = de.DockerExplorerTool()
+    cls.de_object._explorer = cls.explorer_object
+    cls.container_ids = container.GetAllContainersIDs(cls.docker_directory_path)
 
   def testParseArguments(self):
     """Tests the DockerExplorerTool.ParseArguments function."""
-    de_object = de.DockerExplorerTool()
-
-    prog = sys.argv[0]
+    de_object = self.de_object
 
     expected_docker_root = os.path.join('test_data', 'docker')
 
-    args = [prog, '-r', expected_docker_root, 'list', 'repositories']
-    sys.argv = args
-
-    options = de_object.ParseArguments()
+    args = ['-r', expected_docker_root, 'list', 'repositories']
+    options = de_object.ParseArguments(args)
     usage_string = de_object._argument_parser.format_usage()
     expected_usage = '[-h] [-d] [-r DOCKER_DIRECTORY] [-V]'
     expected_usage_commands = '{download,mount,list,history}'
@@ -99,27 +269,32 @@ class TestDEMain(unittest.TestCase):
     self.assertIn(expected_usage_commands, usage_string)
     self.assertEqual(expected_docker_root, options.docker_directory)
 
-  def testShowHistory(self):
-    """Tests that ShowHistory shows history."""
-    self.maxDiff = None
-    de_object = de.DockerExplorerTool()
-    de_object._explorer = self.explorer_object
+    # The parser is only built once.
+    argument_parser = de_object._argument_parser
+    options = de_object.ParseArguments(['history', 'abcdef'])
+    self.assertIs(argument_parser, de_object._argument_parser)
+    self.assertEqual('abcdef', options.container_id)
+
+    # Filters from a previous call aren't kept.
+    de_object.ParseArguments(
+        ['list', 'running_containers', '--filter_repositories', 'k8s.gcr.io'])
+    self.assertEqual(['k8s.gcr.io'], de_object._filter_repositories)
+    de_object.ParseArguments(['list', 'running_containers'])
+    self.assertEqual([], de_object._filter_repositories)
+
+  def testGetHistoryJson(self):
+    """Tests the DockerExplorerTool.GetHistoryJson function."""
     # We pick one of the container IDs.
-    container_id = container.GetAllContainersIDs(self.docker_directory_path)[0]
-    with unittest.mock.patch('sys.stdout', new=StringIO()) as fake_output:
-      de_object.docker_directory = self.docker_directory_path
-      de_object.ShowHistory(container_id)
-      expected_string = """{
-    "sha256:8ac48589692a53a9b8c2d1ceaa6b402665aa7fe667ba51ccc03002300856d8c7": {
-        "created_at": "2018-04-05T10:41:28.876407+00:00", 
-        "container_cmd": "/bin/sh -c #(nop)  CMD [\\"sh\\"]", 
-        "size": 0
-    }
-}
-
-"""
+    container_id = self.container_ids[0]
+    self.assertEqual(
+        _OVERLAY2_HISTORY, self.de_object.GetHistoryJson(container_id))
 
-      self.assertEqual(expected_string, fake_output.getvalue())
+  def testShowHistory(self):
+    """Tests that ShowHistory prints the history as JSON."""
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+      self.de_object.ShowHistory(self.container_ids[0])
+    self.assertEqual(_OVERLAY2_HISTORY, json.loads(output.getvalue()))
 
   def testDetectStorageFail(self):
     """Tests that the DockerExplorerTool.DetectStorage function fails on
@@ -133,35 +308,58 @@ class TestDEMain(unittest.TestCase):
       explorer_object.SetDockerDirectory('this_dir_shouldnt_exist')
     self.assertEqual(expected_error_message, err.exception.message)
 
+  def testDetectStorageNoContainersDirectory(self):
+    """Tests that DetectDockerStorageVersion fails without a containers
+    directory."""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+      explorer_object = explorer.Explorer()
+      explorer_object.SetDockerDirectory(tmp_dir)
+      with self.assertRaises(errors.BadStorageException) as err:
+        explorer_object.DetectDockerStorageVersion()
+      self.assertEqual(
+          f'Containers directory {tmp_dir}/containers does not exist.',
+          err.exception.message)
+
 
 class DockerTestCase(unittest.TestCase):
   """Base class for tests of different Storage implementations."""
 
-  @classmethod
-  def tearDownClass(cls):
-    shutil.rmtree(os.path.join('test_data', 'docker'))
-
   @classmethod
   def _setup(cls, driver, driver_class, storage_version=2):
     """Internal method to set up the TestCase on a specific storage."""
     cls.driver = driver
-    docker_directory_path = os.path.join('test_data', 'docker')
-    if not os.path.isdir(docker_directory_path):
-      docker_tar = os.path.join('test_data', f'{driver}.v{storage_version}.tgz')
-      with tarfile.open(docker_tar, 'r:gz') as tar:
-        tar.extractall('test_data')
-        tar.close()
-
-    cls.explorer_object = explorer.Explorer()
-    cls.explorer_object.SetDockerDirectory(docker_directory_path)
-    cls.explorer_object.DetectDockerStorageVersion()
+    cls.explorer_object = _GetExplorer(
+        f'{driver}.v{storage_version}.tgz', storage_version)
+    cls.docker_directory_path = cls.explorer_object.docker_directory
 
     cls.driver_class = driver_class
     cls.storage_version = storage_version
+    # Tests only read from the containers, so they are loaded once per class.
+    cls.containers = tuple(cls.explorer_object.GetAllContainers())
+    cls.containers_by_id = {c.container_id: c for c in cls.containers}
+
+  def _GetContainer(self, container_id):
+    """Returns one of the containers loaded in _setup().
+
+    Args:
+      container_id (str): the full container ID.
+
+    Returns:
+      container.Container: the container object.
+    """
+    return self.containers_by_id[container_id]
+
+  def testDetectDockerStorageVersion(self):
+    """Tests the Explorer.DetectDockerStorageVersion function."""
+    explorer_object = explorer.Explorer()
+    explorer_object.SetDockerDirectory(self.docker_directory_path)
+    explorer_object.docker_version = None
+    explorer_object.DetectDockerStorageVersion()
+    self.assertEqual(self.storage_version, explorer_object.docker_version)
 
   def testDetectStorage(self):
     """Tests the Explorer.DetectStorage function."""
-    for container_obj in self.explorer_object.GetAllContainers():
+    for container_obj in self.containers:
       self.assertIsNotNone(container_obj.storage_object)
       self.assertEqual(container_obj.storage_name, self.driver)
       self.assertIsInstance(container_obj.storage_object, self.driver_class)
@@ -183,26 +381,20 @@ class TestAufsStorage(DockerTestCase):
 
   def testGetAllContainers(self):
     """Tests the GetAllContainers function on a AuFS storage."""
-    containers_list = self.explorer_object.GetAllContainers()
-    containers_list = sorted(containers_list, key=lambda ci: ci.name)
+    containers_list = self.containers
     self.assertEqual(7, len(containers_list))
 
-    container_obj = containers_list[1]
-
-    self.assertEqual('/dreamy_snyder', container_obj.name)
-    self.assertEqual(
-        '2017-02-13T16:45:05.629904159Z', container_obj.creation_timestamp)
-    self.assertEqual('busybox', container_obj.config_image_name)
-    self.assertTrue(container_obj.running)
+    container_obj = heapq.nsmallest(
+        2, containers_list, key=operator.attrgetter('name'))[1]
 
     self.assertEqual(
-        '7b02fb3e8a665a63e32b909af5babb7d6ba0b64e10003b2d9534c7d5f2af8966',
-        container_obj.container_id)
+        ('/dreamy_snyder', '2017-02-13T16:45:05.629904159Z', 'busybox', True,
+         _AUFS_CONTAINER_ID),
+        _CONTAINER_SUMMARY(container_obj))
 
   def testGetOrderedLayers(self):
     """Tests the BaseStorage.GetOrderedLayers function on a AuFS storage."""
-    container_obj = self.explorer_object.GetContainer(
-        '7b02fb3e8a665a63e32b909af5babb7d6ba0b64e10003b2d9534c7d5f2af8966')
+    container_obj = self._GetContainer(_AUFS_CONTAINER_ID)
     layers = container_obj.GetOrderedLayers()
     self.assertEqual(1, len(layers))
     self.assertEqual(
@@ -214,8 +406,6 @@ class TestAufsStorage(DockerTestCase):
     """Tests the BaseStorage.GetContainersList function on a AuFS storage."""
     running_containers = self.explorer_object.GetContainersList(
         only_running=True)
-    running_containers = sorted(
-        running_containers, key=lambda ci: ci.container_id)
     self.assertEqual(1, len(running_containers))
     container_obj = running_containers[0]
     self.assertEqual('/dreamy_snyder', container_obj.name)
@@ -231,14 +421,14 @@ class TestAufsStorage(DockerTestCase):
 
     mount_point = collections.OrderedDict()
     mount_point['source'] = (
-        'test_data/docker/volumes/'
+        f'{self.docker_directory_path}/volumes/'
         '28297de547b5473a9aff90aaab45ed108ebf019981b40c3c35c226f54c13ac0d/_data'
     )
     mount_point['destination'] = '/var/jenkins_home'
 
     expected = collections.OrderedDict()
     expected['image_name'] = 'busybox'
-    expected['container_id'] = '7b02fb3e8a665a63e32b909af5babb7d6ba0b64e10003b2d9534c7d5f2af8966'
+    expected['container_id'] = _AUFS_CONTAINER_ID
     expected['image_id'] = '7968321274dc6b6171697c33df7815310468e694ac5be0ec03ff053bb135e768'
     expected['start_date'] = '2017-02-13T16:45:05.785658+00:00'
     expected['mount_id'] = 'b16a494082bba0091e572b58ff80af1b7b5d28737a3eedbe01e73cd7f4e01d23'
@@ -249,8 +439,7 @@ class TestAufsStorage(DockerTestCase):
 
   def testGetLayerInfo(self):
     """Tests the BaseStorage.GetLayerInfo function on a AuFS storage."""
-    container_obj = self.explorer_object.GetContainer(
-        '7b02fb3e8a665a63e32b909af5babb7d6ba0b64e10003b2d9534c7d5f2af8966')
+    container_obj = self._GetContainer(_AUFS_CONTAINER_ID)
     layer_info = container_obj.GetLayerInfo(
         'sha256:'
         '7968321274dc6b6171697c33df7815310468e694ac5be0ec03ff053bb135e768')
@@ -262,44 +451,52 @@ class TestAufsStorage(DockerTestCase):
     """Tests GetRepositoriesString() on a AuFS storage."""
     self.maxDiff = None
     result_string = self.explorer_object.GetRepositoriesString()
-    expected_string = (
-        '[\n'
-        '    {\n'
-        '        "Repositories": {\n'
-        '            "busybox": {\n'
-        '                "busybox:latest": "sha256:'
-        '7968321274dc6b6171697c33df7815310468e694ac5be0ec03ff053bb135e768"\n'
-        '            }\n'
-        '        }, \n'
-        '        "path": "test_data/docker/image/aufs/repositories.json"\n'
-        '    }\n'
-        ']\n')
-    self.assertEqual(expected_string, result_string)
+    expected_repositories = [{
+        'Repositories': {
+            'busybox': {
+                'busybox:latest': 'sha256:'
+                '7968321274dc6b6171697c33df7815310468e694ac5be0ec03ff053bb135e768'
+            }
+        },
+        'path': f'{self.docker_directory_path}/image/aufs/repositories.json'
+    }]
+    self.assertListEqual(expected_repositories, json.loads(result_string))
+
+  def testGetRepositoriesJson(self):
+    """Tests GetRepositoriesJson() on a AuFS storage."""
+    repositories = self.explorer_object.GetRepositoriesJson()
+    self.assertEqual(1, len(repositories))
+    self.assertEqual(
+        f'{self.docker_directory_path}/image/aufs/repositories.json',
+        repositories[0]['path'])
+    self.assertDictEqual(
+        {'busybox': {
+            'busybox:latest': 'sha256:'
+            '7968321274dc6b6171697c33df7815310468e694ac5be0ec03ff053bb135e768'}},
+        repositories[0]['Repositories'])
 
   def testMakeMountCommands(self):
     """Tests the BaseStorage.MakeMountCommands function on a AuFS storage."""
     self.maxDiff = None
-    container_obj = self.explorer_object.GetContainer(
-        '7b02fb3e8a665a63e32b909af5babb7d6ba0b64e10003b2d9534c7d5f2af8966')
+    container_obj = self._GetContainer(_AUFS_CONTAINER_ID)
     commands = container_obj.storage_object.MakeMountCommands(
         container_obj, '/mnt')
     commands = [' '.join(x) for x in commands]
     expected_commands = [
         (
-            '/bin/mount -t aufs -o ro,br=test_data/docker/aufs/diff/test_data/'
-            'docker/aufs/diff/'
+            f'/bin/mount -t aufs -o ro,br={self.docker_directory_path}/aufs/diff/'
             'b16a494082bba0091e572b58ff80af1b7b5d28737a3eedbe01e73cd7f4e01d23'
             '=ro+wh none /mnt'),
         (
-            '/bin/mount -t aufs -o ro,remount,append:test_data/docker/aufs/diff/'
+            f'/bin/mount -t aufs -o ro,remount,append:{self.docker_directory_path}/aufs/diff/'
             'b16a494082bba0091e572b58ff80af1b7b5d28737a3eedbe01e73cd7f4e01d23'
             '-init=ro+wh none /mnt'),
         (
-            '/bin/mount -t aufs -o ro,remount,append:test_data/docker/aufs/diff/'
+            f'/bin/mount -t aufs -o ro,remount,append:{self.docker_directory_path}/aufs/diff/'
             'd1c54c46d331de21587a16397e8bd95bdbb1015e1a04797c76de128107da83ae'
             '=ro+wh none /mnt'),
         (
-            '/bin/mount --bind -o ro test_data/docker/volumes/'
+            f'/bin/mount --bind -o ro {self.docker_directory_path}/volumes/'
             '28297de547b5473a9aff90aaab45ed108ebf019981b40c3c35c226f54c13ac0d/'
             '_data /mnt/var/jenkins_home')
     ]
@@ -308,18 +505,8 @@ class TestAufsStorage(DockerTestCase):
   def testGetHistory(self):
     """Tests the BaseStorage.GetHistory function on a AuFS storage."""
     self.maxDiff = None
-    container_obj = self.explorer_object.GetContainer(
-        '7b02fb3e8a665a63e32b909af5babb7d6ba0b64e10003b2d9534c7d5f2af8966')
-    expected = collections.OrderedDict({
-        'sha256:'
-        '7968321274dc6b6171697c33df7815310468e694ac5be0ec03ff053bb135e768': {
-            'created_at': '2017-01-13T22:13:54.401355+00:00',
-            'container_cmd': '/bin/sh -c #(nop)  CMD ["sh"]',
-            'size': 0
-        }
-    })
-
-    self.assertEqual(expected, container_obj.GetHistory())
+    container_obj = self._GetContainer(_AUFS_CONTAINER_ID)
+    self.assertEqual(_AUFS_HISTORY, container_obj.GetHistory())
 
   def testGetFullContainerID(self):
     """Tests the DockerExplorerTool._GetFullContainerID function on AuFS."""
@@ -356,26 +543,19 @@ class TestAufsV1Storage(DockerTestCase):
 
   def testGetAllContainers(self):
     """Tests the GetAllContainers function on a AuFS storage."""
-    containers_list = self.explorer_object.GetAllContainers()
-    containers_list = sorted(containers_list, key=lambda ci: ci.name)
+    containers_list = self.containers
     self.assertEqual(3, len(containers_list))
 
-    container_obj = containers_list[0]
-
-    self.assertEqual('/angry_rosalind', container_obj.name)
-    self.assertEqual(
-        '2018-12-27T10:53:17.096746609Z', container_obj.creation_timestamp)
-    self.assertEqual('busybox', container_obj.config_image_name)
-    self.assertTrue(container_obj.running)
+    container_obj = min(containers_list, key=operator.attrgetter('name'))
 
     self.assertEqual(
-        'de44dd97cfd1c8d1c1aad7f75a435603991a7a39fa4f6b20a69bf4458809209c',
-        container_obj.container_id)
+        ('/angry_rosalind', '2018-12-27T10:53:17.096746609Z', 'busybox', True,
+         _AUFS_V1_CONTAINER_ID),
+        _CONTAINER_SUMMARY(container_obj))
 
   def testGetOrderedLayers(self):
     """Tests the BaseStorage.GetOrderedLayers function on a AuFS storage."""
-    container_obj = self.explorer_object.GetContainer(
-        'de44dd97cfd1c8d1c1aad7f75a435603991a7a39fa4f6b20a69bf4458809209c')
+    container_obj = self._GetContainer(_AUFS_V1_CONTAINER_ID)
     layers = container_obj.GetOrderedLayers()
     self.assertEqual(2, len(layers))
     self.assertEqual(
@@ -386,8 +566,6 @@ class TestAufsV1Storage(DockerTestCase):
     """Tests the BaseStorage.GetContainersList function on a AuFS storage."""
     running_containers = self.explorer_object.GetContainersList(
         only_running=True)
-    running_containers = sorted(
-        running_containers, key=lambda ci: ci.container_id)
     self.assertEqual(1, len(running_containers))
     container_obj = running_containers[0]
     self.assertEqual('/angry_rosalind', container_obj.name)
@@ -402,7 +580,7 @@ class TestAufsV1Storage(DockerTestCase):
 
     expected = collections.OrderedDict()
     expected['image_name'] = 'busybox'
-    expected['container_id'] = 'de44dd97cfd1c8d1c1aad7f75a435603991a7a39fa4f6b20a69bf4458809209c'
+    expected['container_id'] = _AUFS_V1_CONTAINER_ID
     expected['image_id'] = '1cee97b18f87b5fa91633db35f587e2c65c093facfa2cbbe83d5ebe06e1d9125'
     expected['start_date'] = '2018-12-27T10:53:17.409426+00:00'
     expected['log_path'] = '/var/lib/docker/containers/de44dd97cfd1c8d1c1aad7f75a435603991a7a39fa4f6b20a69bf4458809209c/de44dd97cfd1c8d1c1aad7f75a435603991a7a39fa4f6b20a69bf4458809209c-json.log'
@@ -411,8 +589,7 @@ class TestAufsV1Storage(DockerTestCase):
 
   def testGetLayerInfo(self):
     """Tests the BaseStorage.GetLayerInfo function on a AuFS storage."""
-    container_obj = self.explorer_object.GetContainer(
-        'de44dd97cfd1c8d1c1aad7f75a435603991a7a39fa4f6b20a69bf4458809209c')
+    container_obj = self._GetContainer(_AUFS_V1_CONTAINER_ID)
     layer_info = container_obj.GetLayerInfo(
         '1cee97b18f87b5fa91633db35f587e2c65c093facfa2cbbe83d5ebe06e1d9125')
     self.assertEqual('2018-12-26T08:20:42.831353376Z', layer_info['created'])
@@ -423,43 +600,39 @@ class TestAufsV1Storage(DockerTestCase):
     """Tests GetRepositoriesString() on a AuFS storage."""
     self.maxDiff = None
     result_string = self.explorer_object.GetRepositoriesString()
-    expected_string = (
-        '[\n'
-        '    {\n'
-        '        "Repositories": {\n'
-        '            "busybox": {\n'
-        '                "latest": "'
-        '1cee97b18f87b5fa91633db35f587e2c65c093facfa2cbbe83d5ebe06e1d9125"\n'
-        '            }\n'
-        '        }, \n'
-        '        "path": "test_data/docker/repositories-aufs"\n'
-        '    }\n'
-        ']\n')
-    self.assertEqual(expected_string, result_string)
+    expected_repositories = [{
+        'Repositories': {
+            'busybox': {
+                'latest':
+                '1cee97b18f87b5fa91633db35f587e2c65c093facfa2cbbe83d5ebe06e1d9125'
+            }
+        },
+        'path': f'{self.docker_directory_path}/repositories-aufs'
+    }]
+    self.assertListEqual(expected_repositories, json.loads(result_string))
 
   def testMakeMountCommands(self):
     """Tests the BaseStorage.MakeMountCommands function on a AuFS storage."""
-    container_obj = self.explorer_object.GetContainer(
-        'de44dd97cfd1c8d1c1aad7f75a435603991a7a39fa4f6b20a69bf4458809209c')
+    container_obj = self._GetContainer(_AUFS_V1_CONTAINER_ID)
     commands = container_obj.storage_object.MakeMountCommands(
         container_obj, '/mnt')
     commands = [' '.join(x) for x in commands]
     expected_commands = [
         (
-            '/bin/mount -t aufs -o ro,br=test_data/'
-            'docker/aufs/diff/'
+            '/bin/mount -t aufs -o ro,br='
+            f'{self.docker_directory_path}/aufs/diff/'
             'de44dd97cfd1c8d1c1aad7f75a435603991a7a39fa4f6b20a69bf4458809209c'
             '=ro+wh none /mnt'),
         (
-            '/bin/mount -t aufs -o ro,remount,append:test_data/docker/aufs/diff/'
+            f'/bin/mount -t aufs -o ro,remount,append:{self.docker_directory_path}/aufs/diff/'
             'de44dd97cfd1c8d1c1aad7f75a435603991a7a39fa4f6b20a69bf4458809209c'
             '-init=ro+wh none /mnt'),
         (
-            '/bin/mount -t aufs -o ro,remount,append:test_data/docker/aufs/diff/'
+            f'/bin/mount -t aufs -o ro,remount,append:{self.docker_directory_path}/aufs/diff/'
             '1cee97b18f87b5fa91633db35f587e2c65c093facfa2cbbe83d5ebe06e1d9125'
             '=ro+wh none /mnt'),
         (
-            '/bin/mount -t aufs -o ro,remount,append:test_data/docker/aufs/diff/'
+            f'/bin/mount -t aufs -o ro,remount,append:{self.docker_directory_path}/aufs/diff/'
             'df557f39d413a1408f5c28d8aab2892f927237ec22e903ef04b331305130ab38'
             '=ro+wh none /mnt')
     ]
@@ -468,28 +641,13 @@ class TestAufsV1Storage(DockerTestCase):
   def testGetHistory(self):
     """Tests the BaseStorage.GetHistory function on a AuFS storage."""
     self.maxDiff = None
-    container_obj = self.explorer_object.GetContainer(
-        'de44dd97cfd1c8d1c1aad7f75a435603991a7a39fa4f6b20a69bf4458809209c')
-    expected = {
-        '1cee97b18f87b5fa91633db35f587e2c65c093facfa2cbbe83d5ebe06e1d9125':
-           collections.OrderedDict({
-               'size': 0
-           }),
-        'df557f39d413a1408f5c28d8aab2892f927237ec22e903ef04b331305130ab38':
-           collections.OrderedDict({
-               'created_at':
-               '2018-12-26T08:20:42.687925+00:00',
-               'container_cmd': '/bin/sh -c #(nop) ADD file:ce026b62356eec3ad1214f92be2c9dc063fe205bd5e600be3492c4dfb17148bd in / ',
-               'size': 1154361
-           })
-    }
-
-    self.assertEqual(expected, container_obj.GetHistory())
+    container_obj = self._GetContainer(_AUFS_V1_CONTAINER_ID)
+    self.assertEqual(_AUFS_V1_HISTORY, container_obj.GetHistory())
 
   def testGetFullContainerID(self):
     """Tests the DockerExplorerTool._GetFullContainerID function on AuFS."""
     self.assertEqual(
-        'de44dd97cfd1c8d1c1aad7f75a435603991a7a39fa4f6b20a69bf4458809209c',
+        _AUFS_V1_CONTAINER_ID,
         self.explorer_object._GetFullContainerID('de44dd'))
 
     self.maxDiff = None
@@ -518,26 +676,19 @@ class TestOverlayStorage(DockerTestCase):
 
   def testGetAllContainers(self):
     """Tests the GetAllContainers function on a Overlay storage."""
-    containers_list = self.explorer_object.GetAllContainers()
-    containers_list = sorted(containers_list, key=lambda ci: ci.name)
+    containers_list = self.containers
     self.assertEqual(6, len(containers_list))
 
-    container_obj = containers_list[0]
+    container_obj = min(containers_list, key=operator.attrgetter('name'))
 
-    self.assertEqual('/elastic_booth', container_obj.name)
     self.assertEqual(
-        '2018-01-26T14:55:56.280943771Z', container_obj.creation_timestamp)
-    self.assertEqual('busybox:latest', container_obj.config_image_name)
-    self.assertTrue(container_obj.running)
-
-    self.assertEqual(
-        '5dc287aa80b460652a5584e80a5c8c1233b0c0691972d75424cf5250b917600a',
-        container_obj.container_id)
+        ('/elastic_booth', '2018-01-26T14:55:56.280943771Z', 'busybox:latest', True,
+         _OVERLAY_CONTAINER_ID),
+        _CONTAINER_SUMMARY(container_obj))
 
   def testGetOrderedLayers(self):
     """Tests the BaseStorage.GetOrderedLayers function on a Overlay storage."""
-    container_obj = self.explorer_object.GetContainer(
-        '5dc287aa80b460652a5584e80a5c8c1233b0c0691972d75424cf5250b917600a')
+    container_obj = self._GetContainer(_OVERLAY_CONTAINER_ID)
     layers = container_obj.GetOrderedLayers()
     self.assertEqual(1, len(layers))
     self.assertEqual(
@@ -549,8 +700,6 @@ class TestOverlayStorage(DockerTestCase):
     """Tests the BaseStorage.GetContainersList function on a Overlay storage."""
     running_containers = self.explorer_object.GetContainersList(
         only_running=True)
-    running_containers = sorted(
-        running_containers, key=lambda ci: ci.container_id)
     self.assertEqual(1, len(running_containers))
     container_obj = running_containers[0]
     self.assertEqual('/elastic_booth', container_obj.name)
@@ -566,19 +715,18 @@ class TestOverlayStorage(DockerTestCase):
 
     expected = collections.OrderedDict()
     expected['image_name'] = 'busybox:latest'
-    expected['container_id'] = '5dc287aa80b460652a5584e80a5c8c1233b0c0691972d75424cf5250b917600a'
+    expected['container_id'] = _OVERLAY_CONTAINER_ID
     expected['image_id'] = '5b0d59026729b68570d99bc4f3f7c31a2e4f2a5736435641565d93e7c25bd2c3'
     expected['start_date'] = '2018-01-26T14:55:56.574924+00:00'
     expected['mount_id'] = '974e2b994f9db74e1ddd6fc546843bc65920e786612a388f25685acf84b3fed1'
-    expected['upper_dir'] = 'test_data/docker/overlay/974e2b994f9db74e1ddd6fc546843bc65920e786612a388f25685acf84b3fed1/upper'
+    expected['upper_dir'] = f'{self.docker_directory_path}/overlay/974e2b994f9db74e1ddd6fc546843bc65920e786612a388f25685acf84b3fed1/upper'
     expected['log_path'] = '/var/lib/docker/containers/5dc287aa80b460652a5584e80a5c8c1233b0c0691972d75424cf5250b917600a/5dc287aa80b460652a5584e80a5c8c1233b0c0691972d75424cf5250b917600a-json.log'
 
     self.assertEqual([expected], result)
 
   def testGetLayerInfo(self):
     """Tests the BaseStorage.GetLayerInfo function on a Overlay storage."""
-    container_obj = self.explorer_object.GetContainer(
-        '5dc287aa80b460652a5584e80a5c8c1233b0c0691972d75424cf5250b917600a')
+    container_obj = self._GetContainer(_OVERLAY_CONTAINER_ID)
     layer_info = container_obj.GetLayerInfo(
         'sha256:'
         '5b0d59026729b68570d99bc4f3f7c31a2e4f2a5736435641565d93e7c25bd2c3')
@@ -590,37 +738,32 @@ class TestOverlayStorage(DockerTestCase):
     """Tests GetRepositoriesString() on a Overlay storage."""
     result_string = self.explorer_object.GetRepositoriesString()
     self.maxDiff = None
-    expected_string = (
-        '[\n'
-        '    {\n'
-        '        "Repositories": {\n'
-        '            "busybox": {\n'
-        '                "busybox:latest": "sha256:'
-        '5b0d59026729b68570d99bc4f3f7c31a2e4f2a5736435641565d93e7c25bd2c3", \n'
-        '                "busybox@sha256:'
-        '1669a6aa7350e1cdd28f972ddad5aceba2912f589f19a090ac75b7083da748db": '
-        '"sha256:'
-        '5b0d59026729b68570d99bc4f3f7c31a2e4f2a5736435641565d93e7c25bd2c3"\n'
-        '            }\n'
-        '        }, \n'
-        '        "path": "test_data/docker/image/overlay/repositories.json"\n'
-        '    }\n'
-        ']\n')
-
-    self.assertEqual(expected_string, result_string)
+    expected_repositories = [{
+        'Repositories': {
+            'busybox': {
+                'busybox:latest': 'sha256:'
+                '5b0d59026729b68570d99bc4f3f7c31a2e4f2a5736435641565d93e7c25bd2c3',
+                'busybox@sha256:'
+                '1669a6aa7350e1cdd28f972ddad5aceba2912f589f19a090ac75b7083da748db':
+                'sha256:'
+                '5b0d59026729b68570d99bc4f3f7c31a2e4f2a5736435641565d93e7c25bd2c3'
+            }
+        },
+        'path': f'{self.docker_directory_path}/image/overlay/repositories.json'
+    }]
+    self.assertListEqual(expected_repositories, json.loads(result_string))
 
   def testMakeMountCommands(self):
     """Tests the BaseStorage.MakeMountCommands function on a Overlay storage."""
-    container_obj = self.explorer_object.GetContainer(
-        '5dc287aa80b460652a5584e80a5c8c1233b0c0691972d75424cf5250b917600a')
+    container_obj = self._GetContainer(_OVERLAY_CONTAINER_ID)
     commands = container_obj.storage_object.MakeMountCommands(
         container_obj, '/mnt')
     commands = [' '.join(cmd) for cmd in commands]
     expected_commands = [(
         '/bin/mount -t overlay overlay -o ro,lowerdir='
-        'test_data/docker/overlay/974e2b994f9db74e1ddd6fc546843bc65920e786612'
+        f'{self.docker_directory_path}/overlay/974e2b994f9db74e1ddd6fc546843bc65920e786612'
         'a388f25685acf84b3fed1/upper:'
-        'test_data/docker/overlay/a94d714512251b0d8a9bfaacb832e0c6cb70f71cb71'
+        f'{self.docker_directory_path}/overlay/a94d714512251b0d8a9bfaacb832e0c6cb70f71cb71'
         '976cca7a528a429336aae/root '
         '/mnt')]
     self.assertEqual(expected_commands, commands)
@@ -628,22 +771,13 @@ class TestOverlayStorage(DockerTestCase):
   def testGetHistory(self):
     """Tests the BaseStorage.GetHistory function on a Overlay storage."""
     self.maxDiff = None
-    container_obj = self.explorer_object.GetContainer(
-        '5dc287aa80b460652a5584e80a5c8c1233b0c0691972d75424cf5250b917600a')
-    expected = collections.OrderedDict({
-        'sha256:'
-        '5b0d59026729b68570d99bc4f3f7c31a2e4f2a5736435641565d93e7c25bd2c3': {
-            'created_at': '2018-01-24T04:29:35.590938+00:00',
-            'container_cmd': '/bin/sh -c #(nop)  CMD ["sh"]',
-            'size': 0
-        }
-    })
-    self.assertEqual(expected, container_obj.GetHistory())
+    container_obj = self._GetContainer(_OVERLAY_CONTAINER_ID)
+    self.assertEqual(_OVERLAY_HISTORY, container_obj.GetHistory())
 
   def testGetFullContainerID(self):
     """Tests the DockerExplorerTool._GetFullContainerID function on Overlay."""
     self.assertEqual(
-        '5dc287aa80b460652a5584e80a5c8c1233b0c0691972d75424cf5250b917600a',
+        _OVERLAY_CONTAINER_ID,
         self.explorer_object._GetFullContainerID('5dc287aa80'))
 
     with self.assertRaises(Exception) as err:
@@ -670,30 +804,22 @@ class TestOverlay2Storage(DockerTestCase):
 
   def testGetAllContainers(self):
     """Tests the GetAllContainers function on a Overlay2 storage."""
-    containers_list = self.explorer_object.GetAllContainers()
-    containers_list = sorted(containers_list, key=lambda ci: ci.name)
+    containers_list = self.containers
+    containers_list = sorted(containers_list, key=operator.attrgetter('name'))
     self.assertEqual(5, len(containers_list))
 
     container_obj = containers_list[0]
 
-    self.assertEqual('/festive_perlman', container_obj.name)
     self.assertEqual(
-        '2018-05-16T10:51:39.271019533Z', container_obj.creation_timestamp)
-    self.assertEqual('busybox', container_obj.config_image_name)
-    self.assertTrue(container_obj.running)
-    self.assertEqual(
-        '8e8b7f23eb7cbd4dfe7e91646ddd0e0f524218e25d50113559f078dfb2690206',
-        container_obj.container_id)
+        ('/festive_perlman', '2018-05-16T10:51:39.271019533Z', 'busybox', True,
+         _OVERLAY2_CONTAINER_ID),
+        _CONTAINER_SUMMARY(container_obj))
 
     container_obj = containers_list[3]
-    self.assertEqual('/reverent_wing', container_obj.name)
     self.assertEqual(
-        '2018-05-16T10:51:28.695738065Z', container_obj.creation_timestamp)
-    self.assertEqual('busybox', container_obj.config_image_name)
-    self.assertFalse(container_obj.running)
-    self.assertEqual(
-        '10acac0b3466813c9e1f85e2aa7d06298e51fbfe86bbcb6b7a19dd33d3798f6a',
-        container_obj.container_id)
+        ('/reverent_wing', '2018-05-16T10:51:28.695738065Z', 'busybox', False,
+         '10acac0b3466813c9e1f85e2aa7d06298e51fbfe86bbcb6b7a19dd33d3798f6a'),
+        _CONTAINER_SUMMARY(container_obj))
     self.assertEqual(
         {'12345/tcp': {}, '27017/tcp': {}}, container_obj.exposed_ports)
 
@@ -701,10 +827,10 @@ class TestOverlay2Storage(DockerTestCase):
     """Tests the filter function of GetContainersList()."""
     containers_list = self.explorer_object.GetContainersList(
         filter_repositories=['gcr.io'])
-    containers_list = sorted(containers_list, key=lambda ci: ci.name)
+    containers_list = sorted(containers_list, key=operator.attrgetter('name'))
     self.assertEqual(4, len(containers_list))
     expected_containers = [
-        '8e8b7f23eb7cbd4dfe7e91646ddd0e0f524218e25d50113559f078dfb2690206',
+        _OVERLAY2_CONTAINER_ID,
         '9949fa153b778e39d6cab0a4e0ba60fa34a13fedb1f256d613a2f88c0c98408a',
         '10acac0b3466813c9e1f85e2aa7d06298e51fbfe86bbcb6b7a19dd33d3798f6a',
         '61ba4e6c012c782186c649466157e05adfd7caa5b551432de51043893cae5353']
@@ -713,8 +839,7 @@ class TestOverlay2Storage(DockerTestCase):
 
   def testGetOrderedLayers(self):
     """Tests the BaseStorage.GetOrderedLayers function on a Overlay2 storage."""
-    container_obj = self.explorer_object.GetContainer(
-        '8e8b7f23eb7cbd4dfe7e91646ddd0e0f524218e25d50113559f078dfb2690206')
+    container_obj = self._GetContainer(_OVERLAY2_CONTAINER_ID)
     layers = container_obj.GetOrderedLayers()
     self.assertEqual(1, len(layers))
     self.assertEqual(
@@ -726,8 +851,6 @@ class TestOverlay2Storage(DockerTestCase):
     """Tests the BaseStorage.GetContainersList function on Overlay2 storage."""
     running_containers = self.explorer_object.GetContainersList(
         only_running=True)
-    running_containers = sorted(
-        running_containers, key=lambda ci: ci.container_id)
     self.assertEqual(1, len(running_containers))
     container_obj = running_containers[0]
     self.assertEqual('/festive_perlman', container_obj.name)
@@ -737,25 +860,30 @@ class TestOverlay2Storage(DockerTestCase):
 
     self.assertTrue(container_obj.running)
 
+    # Stopped containers are skipped before their configuration is parsed.
+    self.assertEqual(
+        [_OVERLAY2_CONTAINER_ID],
+        [c.container_id for c in self.explorer_object.GetAllContainers(
+            only_running=True)])
+
   def testGetContainersJson(self):
     """Tests the GetContainersJson function on a Overlay2 storage."""
     result = self.explorer_object.GetContainersJson(only_running=True)
 
     expected = collections.OrderedDict()
     expected['image_name'] = 'busybox'
-    expected['container_id'] = '8e8b7f23eb7cbd4dfe7e91646ddd0e0f524218e25d50113559f078dfb2690206'
+    expected['container_id'] = _OVERLAY2_CONTAINER_ID
     expected['image_id'] = '8ac48589692a53a9b8c2d1ceaa6b402665aa7fe667ba51ccc03002300856d8c7'
     expected['start_date'] = '2018-05-16T10:51:39.625989+00:00'
     expected['mount_id'] = '92fd3b3e7d6101bb701743c9518c45b0d036b898c8a3d7cae84e1a06e6829b53'
-    expected['upper_dir'] = 'test_data/docker/overlay2/92fd3b3e7d6101bb701743c9518c45b0d036b898c8a3d7cae84e1a06e6829b53/diff'
+    expected['upper_dir'] = f'{self.docker_directory_path}/overlay2/92fd3b3e7d6101bb701743c9518c45b0d036b898c8a3d7cae84e1a06e6829b53/diff'
     expected['log_path'] = '/var/lib/docker/containers/8e8b7f23eb7cbd4dfe7e91646ddd0e0f524218e25d50113559f078dfb2690206/8e8b7f23eb7cbd4dfe7e91646ddd0e0f524218e25d50113559f078dfb2690206-json.log'
 
     self.assertEqual([expected], result)
 
   def testGetLayerInfo(self):
     """Tests the BaseStorage.GetLayerInfo function on a Overlay2 storage."""
-    container_obj = self.explorer_object.GetContainer(
-        '8e8b7f23eb7cbd4dfe7e91646ddd0e0f524218e25d50113559f078dfb2690206')
+    container_obj = self._GetContainer(_OVERLAY2_CONTAINER_ID)
     layer_info = container_obj.GetLayerInfo(
         'sha256:'
         '8ac48589692a53a9b8c2d1ceaa6b402665aa7fe667ba51ccc03002300856d8c7')
@@ -767,58 +895,44 @@ class TestOverlay2Storage(DockerTestCase):
     """Tests GetRepositoriesString() on a Overlay2 storage."""
     result_string = self.explorer_object.GetRepositoriesString()
     self.maxDiff = None
-    expected_string = (
-        '[\n'
-        '    {\n'
-        '        "Repositories": {}, \n'
-        '        "path": "test_data/docker/image/overlay/repositories.json"\n'
-        '    }, \n'
-        '    {\n'
-        '        "Repositories": {\n'
-        '            "busybox": {\n'
-        '                "busybox:latest": "sha256:'
-        '8ac48589692a53a9b8c2d1ceaa6b402665aa7fe667ba51ccc03002300856d8c7", \n'
-        '                "busybox@sha256:'
-        '58ac43b2cc92c687a32c8be6278e50a063579655fe3090125dcb2af0ff9e1a64": '
-        '"sha256:'
-        '8ac48589692a53a9b8c2d1ceaa6b402665aa7fe667ba51ccc03002300856d8c7"\n'
-        '            }\n'
-        '        }, \n'
-        '        "path": "test_data/docker/image/overlay2/repositories.json"\n'
-        '    }\n'
-        ']\n')
-    self.assertEqual(expected_string, result_string)
+    expected_repositories = [{
+        'Repositories': {},
+        'path': f'{self.docker_directory_path}/image/overlay/repositories.json'
+    }, {
+        'Repositories': {
+            'busybox': {
+                'busybox:latest': 'sha256:'
+                '8ac48589692a53a9b8c2d1ceaa6b402665aa7fe667ba51ccc03002300856d8c7',
+                'busybox@sha256:'
+                '58ac43b2cc92c687a32c8be6278e50a063579655fe3090125dcb2af0ff9e1a64':
+                'sha256:'
+                '8ac48589692a53a9b8c2d1ceaa6b402665aa7fe667ba51ccc03002300856d8c7'
+            }
+        },
+        'path': f'{self.docker_directory_path}/image/overlay2/repositories.json'
+    }]
+    self.assertListEqual(expected_repositories, json.loads(result_string))
 
   def testMakeMountCommands(self):
     """Tests the BaseStorage.MakeMountCommands function on Overlay2 storage."""
     self.maxDiff = None
-    container_obj = self.explorer_object.GetContainer(
-        '8e8b7f23eb7cbd4dfe7e91646ddd0e0f524218e25d50113559f078dfb2690206')
+    container_obj = self._GetContainer(_OVERLAY2_CONTAINER_ID)
     commands = container_obj.storage_object.MakeMountCommands(
         container_obj, '/mnt')
     commands = [' '.join(cmd) for cmd in commands]
     expected_commands = [(
         '/bin/mount -t overlay overlay -o ro,lowerdir='
-        'test_data/docker/overlay2/'
+        f'{self.docker_directory_path}/overlay2/'
         '92fd3b3e7d6101bb701743c9518c45b0d036b898c8a3d7cae84e1a06e6829b53/diff:'
-        'test_data/docker/overlay2/l/OTFSLJCXWCECIG6FVNGRTWUZ7D:'
-        'test_data/docker/overlay2/l/CH5A7XWSBP2DUPV7V47B7DOOGY /mnt')]
+        f'{self.docker_directory_path}/overlay2/l/OTFSLJCXWCECIG6FVNGRTWUZ7D:'
+        f'{self.docker_directory_path}/overlay2/l/CH5A7XWSBP2DUPV7V47B7DOOGY /mnt')]
     self.assertEqual(expected_commands, commands)
 
   def testGetHistory(self):
     """Tests the BaseStorage.GetHistory function on a Overlay2 storage."""
     self.maxDiff = None
-    container_obj = self.explorer_object.GetContainer(
-        '8e8b7f23eb7cbd4dfe7e91646ddd0e0f524218e25d50113559f078dfb2690206')
-    expected = {
-        'sha256:8ac48589692a53a9b8c2d1ceaa6b402665aa7fe667ba51ccc03002300856d8c7':
-            collections.OrderedDict({
-                'created_at': '2018-04-05T10:41:28.876407+00:00',
-                'container_cmd': '/bin/sh -c #(nop)  CMD ["sh"]',
-                'size': 0
-            })
-    }
-    self.assertEqual(expected, container_obj.GetHistory(container_obj))
+    container_obj = self._GetContainer(_OVERLAY2_CONTAINER_ID)
+    self.assertEqual(_OVERLAY2_HISTORY, container_obj.GetHistory(container_obj))
 
   def testGetFullContainerID(self):
     """Tests the DockerExplorerTool._GetFullContainerID function on Overlay2."""
@@ -919,28 +1033,19 @@ class TestDEVolumes(unittest.TestCase):
   def setUpClass(cls):
     """Internal method to set up the TestCase on a specific storage."""
     cls.driver = 'overlay2'
-    cls.docker_directory_path = os.path.join('test_data', 'docker')
-    if not os.path.isdir(cls.docker_directory_path):
-      docker_tar = os.path.join('test_data', 'vols.v2.tgz')
-      with tarfile.open(docker_tar, 'r:gz') as tar:
-        tar.extractall('test_data')
-        tar.close()
+    cls.docker_directory_path = _ExtractFixture('vols.v2.tgz')
     cls.explorer_object = explorer.Explorer()
     cls.explorer_object.SetDockerDirectory(cls.docker_directory_path)
 
     cls.driver_class = storage.Overlay2Storage
     cls.storage_version = 2
-
-  @classmethod
-  def tearDownClass(cls):
-    shutil.rmtree(cls.docker_directory_path)
+    cls.de_object = de.DockerExplorerTool()
+    cls.de_object._explorer = cls.explorer_object
 
   def testGenerateBindMountPoints(self):
     """Tests generating command to mount 'bind' MountPoints."""
     self.maxDiff = None
-    de_object = de.DockerExplorerTool()
-    de_object._explorer = self.explorer_object
-    container_obj = de_object._explorer.GetContainer(
+    container_obj = self.de_object._explorer.GetContainer(
         '8b6e90cc742bd63f6acb7ecd40ddadb4e5dee27d8db2b739963f7cd2c7bcff4a')
 
     commands = container_obj.storage_object._MakeVolumeMountCommands(
@@ -948,17 +1053,15 @@ class TestDEVolumes(unittest.TestCase):
     commands = [' '.join(x) for x in commands]
     expected_commands = [
         ('/bin/mount --bind -o ro '
-         'test_data/docker/volumes/eda9ee495beccf988d963bf91de0276847e838b9531ab9118caef38a33894bb4/_data '
+         f'{self.docker_directory_path}/volumes/eda9ee495beccf988d963bf91de0276847e838b9531ab9118caef38a33894bb4/_data '
          '/mnt/var/jenkins_home'),
-        '/bin/mount --bind -o ro test_data/docker/opt/vols/bind /mnt/opt']
+        f'/bin/mount --bind -o ro {self.docker_directory_path}/opt/vols/bind /mnt/opt']
     self.assertEqual(expected_commands, commands)
 
   def testGenerateVolumesMountpoints(self):
     """Tests generating command to mount 'volumes' MountPoints."""
     self.maxDiff = None
-    de_object = de.DockerExplorerTool()
-    de_object._explorer = self.explorer_object
-    container_obj = de_object._explorer.GetContainer(
+    container_obj = self.de_object._explorer.GetContainer(
         '712909b5ab80d8785841f12e361c218a2faf5365f9ed525f2a0d6b6590ba89cb')
 
     commands = container_obj.storage_object._MakeVolumeMountCommands(
@@ -966,7 +1069,7 @@ class TestDEVolumes(unittest.TestCase):
     commands = [' '.join(x) for x in commands]
     expected_commands = [(
         '/bin/mount --bind -o ro '
-        'test_data/docker/volumes/f5479c534bbc6e2b9861973c2fbb4863ff5b7b5843c098d7fb1a027fe730a4dc/_data '
+        f'{self.docker_directory_path}/volumes/f5479c534bbc6e2b9861973c2fbb4863ff5b7b5843c098d7fb1a027fe730a4dc/_data '
         '/mnt/opt/vols/volume')]
     self.assertEqual(expected_commands, commands)
 
@@ -21,7 +21,9 @@ A tool to parse offline Docker installation.
 from __future__ import unicode_literals
 
 import argparse
+import functools
 import logging
+import sys
 
 import docker_explorer
 
@@ -130,23 +132,28 @@ class DockerExplorerTool:
         '--show-empty', help='Show empty layers (disabled by default)',
         action='store_true')
 
-  def ParseArguments(self):
+  def ParseArguments(self, args=None):
     """Parses the command line arguments.
 
+    Args:
+      args (list(str)): the arguments to parse. Defaults to sys.argv[1:].
+
     Returns:
       argparse.ArgumentParser: the argument parser object.
     """
-    self._argument_parser = argparse.ArgumentParser()
-    self.AddBasicOptions(self._argument_parser)
+    if not self._argument_parser:
+      self._argument_parser = argparse.ArgumentParser()
+      self.AddBasicOptions(self._argument_parser)
 
-    command_parser = self._argument_parser.add_subparsers(dest='command')
-    self.AddDownloadCommand(command_parser)
-    self.AddMountCommand(command_parser)
-    self.AddListCommand(command_parser)
-    self.AddHistoryCommand(command_parser)
+      command_parser = self._argument_parser.add_subparsers(dest='command')
+      self.AddDownloadCommand(command_parser)
+      self.AddMountCommand(command_parser)
+      self.AddListCommand(command_parser)
+      self.AddHistoryCommand(command_parser)
 
-    opts = self._argument_parser.parse_args()
+    opts = self._argument_parser.parse_args(args)
 
+    self._filter_repositories = []
     if opts.command == 'list':
       if opts.filter_repositories:
         self._filter_repositories = [
@@ -170,17 +177,47 @@ class DockerExplorerTool:
           'Which can then be mounted using standard tools.')
     container_object.Mount(mountpoint)
 
+  def GetContainersJson(self, only_running=False):
+    """Returns the containers to display, filtered by repository.
+
+    Args:
+      only_running (bool): Whether we return only running Containers.
+
+    Returns:
+      list(dict): the containers, as returned by Explorer.GetContainersJson().
+    """
+    return self._explorer.GetContainersJson(
+        only_running=only_running,
+        filter_repositories=self._filter_repositories)
+
   def ShowContainers(self, only_running=False):
     """Displays the running containers.
 
     Args:
       only_running (bool): Whether we display only running Containers.
     """
-    print(utils.PrettyPrintJSON(
-        self._explorer.GetContainersJson(
-            only_running=only_running,
-            filter_repositories=self._filter_repositories),
-        sort_keys=False))
+    utils.WritePrettyJSON(
+        self.GetContainersJson(only_running=only_running), sys.stdout,
+        sort_keys=False)
+    print()
+
+  def ShowRepositories(self):
+    """Displays the images in the local Docker repositories."""
+    utils.WritePrettyJSON(self._explorer.GetRepositoriesJson(), sys.stdout)
+    print()
+
+  def GetHistoryJson(self, container_id, show_empty_layers=False):
+    """Returns the modification history of a container.
+
+    Args:
+      container_id (str): the ID of the container.
+      show_empty_layers (bool): whether to return empty layers.
+
+    Returns:
+      dict: object describing history of the container.
+    """
+    container_object = self._explorer.GetContainer(container_id)
+    return container_object.GetHistory(show_empty_layers)
 
   def ShowHistory(self, container_id, show_empty_layers=False):
     """Prints the modification history of a container.
@@ -189,9 +226,10 @@ class DockerExplorerTool:
       container_id (str): the ID of the container.
       show_empty_layers (bool): whether to display empty layers.
     """
-    container_object = self._explorer.GetContainer(container_id)
-    print(utils.PrettyPrintJSON(container_object.GetHistory(show_empty_layers),
-                                sort_keys=False))
+    utils.WritePrettyJSON(
+        self.GetHistoryJson(container_id, show_empty_layers), sys.stdout,
+        sort_keys=False)
+    print()
 
   def _SetLogging(self, debug):
     """Configures the logging module.
@@ -213,15 +251,18 @@ class DockerExplorerTool:
     handler.setFormatter(formatter)
     logger.addHandler(handler)
 
-  def Main(self):
+  def Main(self, args=None):
     """The main method for the DockerExplorerTool class.
 
     It instantiates the Storage Object and Handles arguments parsing.
 
+    Args:
+      args (list(str)): the command line arguments. Defaults to sys.argv[1:].
+
     Raises:
       ValueError: If the arguments couldn't be parsed.
     """
-    options = self.ParseArguments()
+    options = self.ParseArguments(args)
 
     self._SetLogging(debug=options.debug)
 
@@ -260,12 +301,13 @@ class DockerExplorerTool:
           options.container_id, show_empty_layers=options.show_empty)
 
     elif options.command == 'list':
-      if options.what == 'all_containers':
-        self.ShowContainers()
-      elif options.what == 'running_containers':
-        self.ShowContainers(only_running=True)
-      elif options.what == 'repositories':
-        print(self._explorer.GetRepositoriesString())
+      list_actions = {
+          'all_containers': self.ShowContainers,
+          'running_containers': functools.partial(
+              self.ShowContainers, only_running=True),
+          'repositories': self.ShowRepositories,
+      }
+      list_actions[options.what]()
     else:
       raise ValueError(f'Unhandled command {options.command}')
 
@@ -19,11 +19,17 @@ A tool to merge differencing VHDX files.
 """
 
 import argparse
+import array
+import concurrent.futures
+import itertools
+import mmap
+import os
+import stat
 import sys
 import uuid
 import struct
-import math
 import logging
+from collections import deque
 from collections import namedtuple
 
 logger = logging.getLogger('merge_vhdx')
@@ -31,7 +37,26 @@ logger = logging.getLogger('merge_vhdx')
 REGION_HEADER_OFFSET = 192*1024
 LEN_BAT_ENTRY = 8
 BAT_ENTRY_STATE_BITMASK = 0b00000111
-BAT_ENTRY_OFFSET_LEAD_BYTE_BITMASK = 0b11110000
+BAT_ENTRY_OFFSET_BITMASK = 0xFFFFFFFFFFF00000
+
+# Little-endian unsigned integer fields, compiled once.
+UINT16_STRUCT = struct.Struct('<H')
+UINT32_STRUCT = struct.Struct('<I')
+UINT64_STRUCT = struct.Struct('<Q')
+
+# Region table entry: GUID, file offset, then region length and required
+# indicator.
+REGION_TABLE_HEADER_SIZE = 16
+REGION_TABLE_ENTRY_STRUCT = struct.Struct('<16sQ8x')
+# Metadata table entry: item GUID, offset, then length, bit field and res
+# bytes.
+METADATA_TABLE_HEADER_SIZE = 32
+METADATA_TABLE_ENTRY_STRUCT = struct.Struct('<16sI12x')
+
+# The bits of every possible sector bitmap byte, least significant bit first.
+BYTE_BITMAPS = tuple(
+    tuple(bool(byte_value & (1<<i)) for i in range(0, 8))
+    for byte_value in range(0, 256))
 
 GUID_BAT = '2dc27766-f623-4200-9d64-115e9bfd4a08'
 GUID_METADATA = '8b7ca206-4790-4b9a-b8fe-575f050f886e'
@@ -49,7 +74,8 @@ SB_BLOCK_STATES = [
   'INVALID',
   'INVALID',
   'INVALID',
-  'SB_BLOCK_PRESENT'
+  'SB_BLOCK_PRESENT',
+  'INVALID'
 ]
 
 PAYLOAD_BLOCK_STATES = [
@@ -80,40 +106,52 @@ class BlockAllocationTableEntry:
     offset (int): the offset of the block the BAT entry references
   """
 
+  # A BAT has one entry per block, so don't give each entry a __dict__.
+  __slots__ = ('state', 'offset')
+
   def __init__(self, bat_bytes):
     """Initialises a BlockAllocationTableEntry
 
     Args:
       bat_bytes (bytes): a bytes object representing the BAT entry
     """
-    self.state = self._parseState(bat_bytes)
-    self.offset = self._parseOffset(bat_bytes)
+    self._ParseValue(int.from_bytes(bat_bytes, 'little'))
 
-  def _parseState(self, bat_bytes):
-    """Parses BAT state
+  @classmethod
+  def FromValue(cls, bat_value):
+    """Creates a BAT entry from an already unpacked entry.
 
     Args:
-      bat_bytes (bytes): a bytes object representing the BAT entry
+      bat_value (int): the BAT entry, as a little-endian 64 bit integer
 
-    Raises:
-      NotImplementedError: if called on the base class
+    Returns:
+      BlockAllocationTableEntry: the parsed entry.
     """
-    raise NotImplementedError
+    bat_entry = cls.__new__(cls)
+    bat_entry._ParseValue(bat_value)
+    return bat_entry
 
-  def _parseOffset(self, bat_bytes):
-    """Parses BAT offset
+  def _ParseValue(self, bat_value):
+    """Parses the state and offset of a BAT entry
 
     Args:
-      bat_bytes (bytes): a bytes object with length of 8 representing the entry
-    Returns:
-      int: the offset.
+      bat_value (int): the BAT entry, as a little-endian 64 bit integer
+    """
+    self.state = self._parseState(bat_value & BAT_ENTRY_STATE_BITMASK)
+    # Offset is a 44 bit wide field in the top bits of the entry, and is a
+    # multiple of 1MB, so masking gives the offset in bytes.
+    self.offset = bat_value & BAT_ENTRY_OFFSET_BITMASK
+
+  def _parseState(self, state_int):
+    """Parses BAT state
+
+    Args:
+      state_int (int): the value of the state field
+
+    Raises:
+      NotImplementedError: if called on the base class
     """
-    # Offset is a 44 bit wide field, so use a bitmask for lead 4 bits.
-    offset_lead_byte = bat_bytes[2] & BAT_ENTRY_OFFSET_LEAD_BYTE_BITMASK
-    offset_other_bytes = bat_bytes[3:]
-    # Pad with zeroes for ease of parsing
-    offset_bytes = b'\x00'*2 + bytes([offset_lead_byte]) + offset_other_bytes
-    return struct.unpack("<Q", offset_bytes)[0]
+    raise NotImplementedError
 
 
 class SectorBitmapBATEntry(BlockAllocationTableEntry):
@@ -124,11 +162,13 @@ class SectorBitmapBATEntry(BlockAllocationTableEntry):
     offset (int): the offset of the block the BAT entry references
   """
 
-  def _parseState(self, bat_bytes):
+  __slots__ = ()
+
+  def _parseState(self, state_int):
     """Parses BAT state
 
     Args:
-      bat_bytes (bytes): a bytes object representing the BAT entry
+      state_int (int): the value of the state field
 
     Returns:
       str: the parsed state.
@@ -136,7 +176,6 @@ class SectorBitmapBATEntry(BlockAllocationTableEntry):
     Raises:
       ValueError: if the state field is invalid
     """
-    state_int = bat_bytes[0] & BAT_ENTRY_STATE_BITMASK
     state = SB_BLOCK_STATES[state_int]
     if state == 'INVALID':
       raise ValueError(f'Invalid state {state_int} for sector bitmap entry')
@@ -151,11 +190,13 @@ class PayloadBlockBATEntry(BlockAllocationTableEntry):
     offset (int): the offset of the block the BAT entry references
   """
 
-  def _parseState(self, bat_bytes):
+  __slots__ = ()
+
+  def _parseState(self, state_int):
     """Parses BAT state
 
     Args:
-      bat_bytes (bytes): a bytes object representing the BAT entry
+      state_int (int): the value of the state field
 
     Returns:
       str: the parsed state.
@@ -163,7 +204,6 @@ class PayloadBlockBATEntry(BlockAllocationTableEntry):
     Raises:
       ValueError: if the state field is invalid
     """
-    state_int = bat_bytes[0] & BAT_ENTRY_STATE_BITMASK
     state = PAYLOAD_BLOCK_STATES[state_int]
     if state == 'INVALID':
       raise ValueError(f'Invalid state {state_int} for payload block entry')
@@ -173,15 +213,18 @@ class PayloadBlockBATEntry(BlockAllocationTableEntry):
 class BlockAllocationTable:
   """Represents a VHDX block allocation table.
 
-  Parses the payload and sector bitmap entries into two separate lists.
-  Indexes into the payload entries list represent block numbers while
-  indexes into the sector bitmap entries list represent chunks numbers.
+  Parses the payload and sector bitmap entries into two separate tables.
+  Each table is stored as an array of states and an array of offsets, rather
+  than as one object per entry. Indexes into the payload arrays represent
+  block numbers while indexes into the sector bitmap arrays represent chunks
+  numbers.
 
   Attributes:
-    payload_entries (list(PayloadBlockBitmapBATEntry)): a list of BAT payload
-      entries
-    sector_bitmap_entries (list(SectorBitmapBATEntry)): a list of sector
-      bitmap entries
+    payload_states (array.array): the state of each BAT payload entry
+    payload_offsets (array.array): the offset of each BAT payload entry
+    sector_bitmap_states (array.array): the state of each sector bitmap entry
+    sector_bitmap_offsets (array.array): the offset of each sector bitmap
+      entry
   """
   def __init__(self, bat_bytes, bat_params):
     """Initialises a BlockAllocationTable.
@@ -190,9 +233,13 @@ class BlockAllocationTable:
       bat_bytes (bytes): raw bytes representing the bat table
       bat_params (BATParams): BAT details for error checking
     """
-    parsed_bat = self._ParseBATBytes(bat_bytes, bat_params)
-    self.payload_entries = parsed_bat[0]
-    self.sector_bitmap_entries = parsed_bat[1]
+    payload_values, sector_bitmap_values = self._ParseBATBytes(
+        bat_bytes, bat_params)
+    self.payload_states, self.payload_offsets = self._SplitBATValues(
+        payload_values, PAYLOAD_BLOCK_STATES, 'payload block')
+    self.sector_bitmap_states, self.sector_bitmap_offsets = (
+        self._SplitBATValues(
+            sector_bitmap_values, SB_BLOCK_STATES, 'sector bitmap'))
 
   def _ParseBATBytes(self, bat_bytes, bat_params):
     """Parses the block allocation table
@@ -202,36 +249,66 @@ class BlockAllocationTable:
       bat_params (BatParams): the parsed BAT params
 
     Returns:
-      tuple(list, list): the parsed block allocation table
+      tuple(array.array, array.array): the payload and sector bitmap entries,
+        as 64 bit integers.
 
     Raises:
       ValueError: if the expected number of entries aren't parsed
     """
-    payload_entries = []
-    sector_bitmap_entries = []
-    progress_in_chunk = 0
-
-    for idx in range(0, len(bat_bytes), LEN_BAT_ENTRY):
-      if progress_in_chunk == bat_params.chunk_ratio:
-        # Means this entry is for a sector bitmap block
-        parsed_entry = SectorBitmapBATEntry(bat_bytes[idx:idx+8])
-        sector_bitmap_entries.append(parsed_entry)
-        progress_in_chunk = 0 # Sector bitmap entry means end of this chunk
-      else:
-        parsed_entry = PayloadBlockBATEntry(bat_bytes[idx:idx+8])
-        payload_entries.append(parsed_entry)
-        progress_in_chunk += 1
-
-    total_entries = len(payload_entries) + len(sector_bitmap_entries)
-    if total_entries != bat_params.total_entries:
+    total_entries = len(bat_bytes) // LEN_BAT_ENTRY
+    if (total_entries != bat_params.total_entries or
+        len(bat_bytes) % LEN_BAT_ENTRY):
       raise ValueError(
           'Incorrect number of entries parsed expected '
           f'{bat_params.total_entries} parsed {total_entries}')
 
+    bat_values = array.array('Q')
+    bat_values.frombytes(bat_bytes)
+    if sys.byteorder != 'little':
+      bat_values.byteswap()
+
+    # Each chunk is chunk_ratio payload entries followed by a sector bitmap
+    # entry.
+    chunk_ratio = bat_params.chunk_ratio
+    entries_per_chunk = chunk_ratio + 1
+    sector_bitmap_values = bat_values[chunk_ratio::entries_per_chunk]
+    payload_values = array.array('Q')
+    for chunk_start in range(0, total_entries, entries_per_chunk):
+      payload_values.extend(
+          bat_values[chunk_start:chunk_start + chunk_ratio])
+
     logger.debug(
-        f'Parsed {len(payload_entries)} payload entries and '
-        f'{len(sector_bitmap_entries)} sector bitmap entries')
-    return (payload_entries, sector_bitmap_entries)
+        f'Parsed {len(payload_values)} payload entries and '
+        f'{len(sector_bitmap_values)} sector bitmap entries')
+    return (payload_values, sector_bitmap_values)
+
+  def _SplitBATValues(self, bat_values, state_names, entry_type):
+    """Splits BAT entries into their states and offsets
+
+    Args:
+      bat_values (array.array): the BAT entries, as 64 bit integers
+      state_names (list(str)): the names of the states, indexed by value
+      entry_type (str): the type of entries, for error messages
+
+    Returns:
+      tuple(array.array, array.array): the states and offsets of the entries
+
+    Raises:
+      ValueError: if a state field is invalid
+    """
+    states = array.array(
+        'B', [value & BAT_ENTRY_STATE_BITMASK for value in bat_values])
+    # There are only a handful of distinct states, check each of them once.
+    invalid_states = [
+        state_int for state_int in set(states)
+        if state_names[state_int] == 'INVALID']
+    if invalid_states:
+      index = min(states.index(state_int) for state_int in invalid_states)
+      raise ValueError(
+          f'Invalid state {states[index]} for {entry_type} entry {index}')
+    offsets = array.array(
+        'Q', [value & BAT_ENTRY_OFFSET_BITMASK for value in bat_values])
+    return states, offsets
 
   def GetPayloadBATEntry(self, block_number):
     """Returns a data block entry for for a given block number
@@ -242,7 +319,9 @@ class BlockAllocationTable:
     Returns:
       PayloadBlockBitmapBATEntry: the PayloadBlockBitmapBATEntry object.
     """
-    return self.payload_entries[block_number]
+    return PayloadBlockBATEntry.FromValue(
+        self.payload_states[block_number] |
+        self.payload_offsets[block_number])
 
   def GetSectorBitmapBATEntry(self, chunk_number):
     """Returns a sector bitmap block for for a given chunk number
@@ -253,7 +332,9 @@ class BlockAllocationTable:
     Returns:
       SectorBitmapBATEntry: the SectorBitmapBATEntry object.
     """
-    return self.sector_bitmap_entries[chunk_number]
+    return SectorBitmapBATEntry.FromValue(
+        self.sector_bitmap_states[chunk_number] |
+        self.sector_bitmap_offsets[chunk_number])
 
 
 class VHDXDisk:
@@ -271,6 +352,7 @@ class VHDXDisk:
     disk_params (DiskParams): the parsed disk params
     bat_params (BATParams): the parsed BAT params
     bat_table (BlockAllocationTable): the parsed block allocation table
+    sectors_per_block (int): the number of logical sectors in a block
   """
 
   def __init__(self, vhdx_name, parent_disk=None):
@@ -282,17 +364,44 @@ class VHDXDisk:
     """
     self.vhdx_name = vhdx_name
     self.vhdx_fd = open(vhdx_name, 'rb')  #pylint: disable=consider-using-with
+    self._vhdx_view = memoryview(mmap.mmap(
+        self.vhdx_fd.fileno(), 0, access=mmap.ACCESS_READ))
     self.parent_disk = parent_disk
     self.region_table = self._ParseRegionTable()
     self.metadata_table = self._ParseMetadataTable()
     self.disk_params = self._ParseDiskParams()
     self.bat_params = self._CalculateBATParams()
     self.bat_table = self._ParseBAT()
+    self.sectors_per_block = (self.disk_params.block_size //
+        self.disk_params.logical_sector_size)
+    # Number of bitmap block bytes required to represent one data block
+    self._bitmap_bytes_per_block = self.sectors_per_block // 8
+    # The last decoded sector bitmap, as a (block_number, bitmap) tuple.
+    self._sector_bitmap_cache = (None, None)
+    # Zeroed sector and block, shared by all reads of unallocated data.
+    self._zero_sector = bytes(self.disk_params.logical_sector_size)
+    self._zero_block = bytes(self.disk_params.block_size)
 
   def __del__(self):
     """Explicitly lose the vhdx fd on deletion"""
     self.vhdx_fd.close()
 
+  def _ReadAt(self, offset, size):
+    """Reads bytes from the VHDX file without moving its file position.
+
+    The file is memory mapped, so this doesn't copy the data: the kernel
+    reads it in when the returned view is used, for example when it is
+    written to the merged image.
+
+    Args:
+      offset (int): the offset to read from
+      size (int): the number of bytes to read
+
+    Returns:
+      memoryview: the bytes read
+    """
+    return self._vhdx_view[offset:offset + size]
+
   def _ParseRegionTable(self):
     """Parses a region table from a VHDX disk
 
@@ -300,16 +409,14 @@ class VHDXDisk:
       list(tuple): A list of VHDX regions represented as UUID/offset
         tuples
     """
-    self.vhdx_fd.seek(REGION_HEADER_OFFSET)
-    self.vhdx_fd.seek(8, 1) # Region table signature + checksum
-    entry_count = struct.unpack('<I', self.vhdx_fd.read(4))[0]
-    self.vhdx_fd.seek(4, 1) # Res bytes
+    # Region table signature + checksum, then entry count and res bytes
+    entry_count = UINT32_STRUCT.unpack_from(
+        self._vhdx_view, REGION_HEADER_OFFSET + 8)[0]
+    entries = self._ReadAt(REGION_HEADER_OFFSET + REGION_TABLE_HEADER_SIZE,
+        entry_count*REGION_TABLE_ENTRY_STRUCT.size)
     region_table = {}
-    for _ in range(0, entry_count):
-      guid = str(uuid.UUID(bytes_le=self.vhdx_fd.read(16)))
-      offset = struct.unpack('<Q', self.vhdx_fd.read(8))[0]
-      self.vhdx_fd.seek(8, 1) # Region length + required indicator
-      region_table[guid] = offset
+    for guid_bytes, offset in REGION_TABLE_ENTRY_STRUCT.iter_unpack(entries):
+      region_table[str(uuid.UUID(bytes_le=guid_bytes))] = offset
     return region_table
 
   def _ParseMetadataTable(self):
@@ -319,16 +426,16 @@ class VHDXDisk:
       list(tuple): A list of metadata items represented as UUID/offset
         tuples
     """
-    self.vhdx_fd.seek(self.region_table[GUID_METADATA])
-    self.vhdx_fd.seek(10, 1) # Metadata table signature + res bytes
-    entry_count = struct.unpack('<H', self.vhdx_fd.read(2))[0]
-    self.vhdx_fd.seek(20, 1) # Res bytes
+    metadata_offset = self.region_table[GUID_METADATA]
+    # Metadata table signature + res bytes, then entry count and res bytes
+    entry_count = UINT16_STRUCT.unpack_from(
+        self._vhdx_view, metadata_offset + 10)[0]
+    entries = self._ReadAt(metadata_offset + METADATA_TABLE_HEADER_SIZE,
+        entry_count*METADATA_TABLE_ENTRY_STRUCT.size)
     metadata_table = {}
-    for _ in range(0, entry_count):
-      guid = str(uuid.UUID(bytes_le=self.vhdx_fd.read(16)))
-      offset = struct.unpack('<I', self.vhdx_fd.read(4))[0]
-      self.vhdx_fd.seek(12, 1) # Metadata length + bit field + res bytes
-      metadata_table[guid] = offset
+    for guid_bytes, offset in METADATA_TABLE_ENTRY_STRUCT.iter_unpack(
+        entries):
+      metadata_table[str(uuid.UUID(bytes_le=guid_bytes))] = offset
     return metadata_table
 
   def _ParseFileParam(self):
@@ -338,9 +445,10 @@ class VHDXDisk:
       tuple: a tuple containing the block_size and has_parent items
     """
     file_param_offset = self.metadata_table[GUID_FILE_PARAM]
-    self.vhdx_fd.seek(self.region_table[GUID_METADATA] + file_param_offset)
-    block_size = struct.unpack('<I', self.vhdx_fd.read(4))[0]
-    bitfield = self.vhdx_fd.read(1)[0]
+    file_param_offset += self.region_table[GUID_METADATA]
+    block_size = UINT32_STRUCT.unpack_from(
+        self._vhdx_view, file_param_offset)[0]
+    bitfield = self._vhdx_view[file_param_offset + 4]
     has_parent = False
     if bitfield & (1 << 1):
       has_parent = True
@@ -353,9 +461,8 @@ class VHDXDisk:
       int: the parsed logical sector size
     """
     logical_sector_offset = self.metadata_table[GUID_LOGICAL_SECTOR_SIZE]
-    self.vhdx_fd.seek(
-        self.region_table[GUID_METADATA] + logical_sector_offset)
-    logical_sector_size = struct.unpack('<I', self.vhdx_fd.read(4))[0]
+    logical_sector_size = UINT32_STRUCT.unpack_from(self._vhdx_view,
+        self.region_table[GUID_METADATA] + logical_sector_offset)[0]
     return logical_sector_size
 
   def _ParseDiskSize(self):
@@ -365,8 +472,8 @@ class VHDXDisk:
       int: the parsed virtual disk size
     """
     disk_size_offset = self.metadata_table[GUID_DISK_SIZE]
-    self.vhdx_fd.seek(self.region_table[GUID_METADATA] + disk_size_offset)
-    disk_size = struct.unpack('<Q', self.vhdx_fd.read(8))[0]
+    disk_size = UINT64_STRUCT.unpack_from(self._vhdx_view,
+        self.region_table[GUID_METADATA] + disk_size_offset)[0]
     return disk_size
 
   def _ParseDiskParams(self):
@@ -395,14 +502,14 @@ class VHDXDisk:
     """
     chunk_ratio = ((2**23*self.disk_params.logical_sector_size) //
         self.disk_params.block_size)
-    payload_entries = math.ceil(self.disk_params.virtual_disk_size /
+    # Integer ceiling divisions, floats would lose precision on large disks.
+    payload_entries = -(-self.disk_params.virtual_disk_size //
         self.disk_params.block_size)
-    sector_bitmap_entries = math.ceil(payload_entries / chunk_ratio)
+    sector_bitmap_entries = -(-payload_entries // chunk_ratio)
     if self.disk_params.has_parent:
       total_entries = sector_bitmap_entries * (chunk_ratio+1)
     else:
-      total_entries = payload_entries + math.floor(
-          (payload_entries-1)/chunk_ratio)
+      total_entries = payload_entries + (payload_entries-1) // chunk_ratio
 
     bat_params = BATParams(chunk_ratio, total_entries, payload_entries,
         sector_bitmap_entries)
@@ -415,8 +522,7 @@ class VHDXDisk:
     Returns:
       BlockAllocationTable: the parsed block allocation table
     """
-    self.vhdx_fd.seek(self.region_table[GUID_BAT])
-    bat_blocks = self.vhdx_fd.read(
+    bat_blocks = self._ReadAt(self.region_table[GUID_BAT],
         self.bat_params.total_entries*LEN_BAT_ENTRY)
     return BlockAllocationTable(bat_blocks, self.bat_params)
 
@@ -433,24 +539,30 @@ class VHDXDisk:
       ValueError: if the sector bitmap block BAT entry state is
         SB_BLOCK_NOT_PRESENT.
     """
-    chunk_number = block_number // self.bat_params.chunk_ratio
-    sb_entry = self.bat_table.GetSectorBitmapBATEntry(chunk_number)
-    if sb_entry.state == 'SB_BLOCK_NOT_PRESENT':
+    # Sectors are read in order, so the same bitmap is requested for every
+    # sector of a block.
+    cached_block_number, cached_bitmap = self._sector_bitmap_cache
+    if cached_block_number == block_number:
+      return cached_bitmap
+
+    chunk_number, block_within_chunk = divmod(
+        block_number, self.bat_params.chunk_ratio)
+    # Read the entry straight from the BAT arrays, without building a
+    # SectorBitmapBATEntry.
+    sb_state = self.bat_table.sector_bitmap_states[chunk_number]
+    if SB_BLOCK_STATES[sb_state] == 'SB_BLOCK_NOT_PRESENT':
       raise ValueError('Sector bitmap block not present')
 
-    sectors_per_block = (self.disk_params.block_size //
-        self.disk_params.logical_sector_size)
-    # Number of bitmap block bytes required to represent one data block
-    bitmap_bytes_per_block = sectors_per_block // 8
-    block_within_chunk = block_number % self.bat_params.chunk_ratio
+    bitmap_bytes_per_block = self._bitmap_bytes_per_block
     # Absolute offset within the sector bitmap of bytes representing the
     # target block's bitmap
     block_bitmap_offset = (block_within_chunk*bitmap_bytes_per_block +
-        sb_entry.offset)
+        self.bat_table.sector_bitmap_offsets[chunk_number])
 
-    self.vhdx_fd.seek(block_bitmap_offset)
-    sector_bitmap_bytes = self.vhdx_fd.read(bitmap_bytes_per_block)
+    sector_bitmap_bytes = self._ReadAt(
+        block_bitmap_offset, bitmap_bytes_per_block)
     sector_bitmap = self._ConvertBytesToBitmap(sector_bitmap_bytes)
+    self._sector_bitmap_cache = (block_number, sector_bitmap)
     return sector_bitmap
 
   def _ConvertBytesToBitmap(self, sb_bytes):
@@ -462,14 +574,8 @@ class VHDXDisk:
     Returns:
       list: a list of bools representing the bitmap
     """
-    bitmap = []
-    for sb_byte in sb_bytes:
-      for i in range(0, 8):
-        if sb_byte & (1<<i):
-          bitmap.append(True)
-        else:
-          bitmap.append(False)
-    return bitmap
+    return list(itertools.chain.from_iterable(
+        map(BYTE_BITMAPS.__getitem__, sb_bytes)))
 
   def ReadSector(self, sector):
     """Returns a logical sector's contents
@@ -480,60 +586,240 @@ class VHDXDisk:
     Returns:
       bytes: the sector contents
     """
-    sectors_per_block = (self.disk_params.block_size //
-        self.disk_params.logical_sector_size)
-    block_number = sector // sectors_per_block
-    sector_in_block = sector % sectors_per_block
+    return bytes(self.ReadSectors(sector, 1))
+
+  def ReadSectors(self, sector, sector_count):
+    """Returns the contents of consecutive logical sectors
+
+    Args:
+      sector (int): the first sector number
+      sector_count (int): the number of sectors to read
+
+    Returns:
+      bytes|bytearray|memoryview: the sectors contents
+    """
+    sectors_per_block = self.sectors_per_block
+    end_sector = sector + sector_count
+    sectors = []
+    while sector < end_sector:
+      block_number, sector_in_block = divmod(sector, sectors_per_block)
+      sectors_in_block = min(
+          sectors_per_block - sector_in_block, end_sector - sector)
+      sectors.append(self._ReadSectorsInBlock(
+          block_number, sector_in_block, sectors_in_block))
+      sector += sectors_in_block
+    if len(sectors) == 1:
+      return sectors[0]
+    return b''.join(sectors)
+
+  def LocateBlock(self, block_number):
+    """Returns where a block is stored, if it is stored whole in a file.
+
+    Blocks not present in a differencing disk are looked up in its parents,
+    as long as they use the same block size.
+
+    Args:
+      block_number (int): the block number
+
+    Returns:
+      tuple(VHDXDisk, int): the disk storing the block and the offset of the
+        block in its file, or None if the block isn't stored whole, for
+        example if it is partially present or zeroed.
+    """
+    disk = self
+    while True:
+      bat_entry = disk.bat_table.GetPayloadBATEntry(block_number)
+      if bat_entry.state == 'PAYLOAD_BLOCK_FULLY_PRESENT' and bat_entry.offset:
+        return disk, bat_entry.offset
+      if (bat_entry.state != 'PAYLOAD_BLOCK_NOT_PRESENT' or
+          not disk.disk_params.has_parent):
+        return None
+      # A parent with another block size doesn't have this block whole.
+      if (disk.parent_disk.disk_params.block_size !=
+          disk.disk_params.block_size):
+        return None
+      disk = disk.parent_disk
+
+  def _ReadSectorsInBlock(self, block_number, sector_in_block, sector_count):
+    """Returns the contents of consecutive logical sectors within a block
+
+    Args:
+      block_number (int): the block containing the sectors
+      sector_in_block (int): the first sector to read within the block
+      sector_count (int): the number of sectors to read
+
+    Returns:
+      bytes|bytearray: the sectors contents
+    """
     bat_entry = self.bat_table.GetPayloadBATEntry(block_number)
-    state = bat_entry.state
+    read_sectors = self._SECTORS_READERS[
+        self.bat_table.payload_states[block_number]]
+    return read_sectors(
+        self, bat_entry, block_number, sector_in_block, sector_count)
 
-    if state == 'PAYLOAD_BLOCK_NOT_PRESENT':
-      if self.disk_params.has_parent:
-        sector = self.parent_disk.ReadSector(sector)
-      else:
-        sector = self._ReadSectorBytes(bat_entry, sector_in_block)
-    elif state == 'PAYLOAD_BLOCK_UNDEFINED':
-      sector = self._ReadSectorBytes(bat_entry, sector_in_block)
-    elif state == 'PAYLOAD_BLOCK_ZERO':
-      sector = b'\x00'*self.disk_params.logical_sector_size
-    elif state == 'PAYLOAD_BLOCK_UNMAPPED':
-      sector = self._ReadSectorBytes(bat_entry, sector_in_block)
-    elif state == 'PAYLOAD_BLOCK_FULLY_PRESENT':
-      sector = self._ReadSectorBytes(bat_entry, sector_in_block)
-    elif state == 'PAYLOAD_BLOCK_PARTIALLY_PRESENT':
-      sector_bitmap = self._GetSectorBitmapForBlock(block_number)
-      if sector_bitmap[sector_in_block]:
-        sector = self._ReadSectorBytes(bat_entry, sector_in_block)
+  def _ReadNotPresentSectors(
+      self, bat_entry, block_number, sector_in_block, sector_count):
+    """Returns the contents of sectors in a PAYLOAD_BLOCK_NOT_PRESENT block
+
+    Args:
+      bat_entry (PayloadBlockBATEntry): the BAT entry for the block
+      block_number (int): the block containing the sectors
+      sector_in_block (int): the first sector to read within the block
+      sector_count (int): the number of sectors to read
+
+    Returns:
+      bytes|memoryview: the sectors contents
+    """
+    if self.disk_params.has_parent:
+      return self.parent_disk.ReadSectors(
+          block_number*self.sectors_per_block + sector_in_block, sector_count)
+    return self._ReadSectorBytes(bat_entry, sector_in_block, sector_count)
+
+  def _ReadZeroSectors(  #pylint: disable=unused-argument
+      self, bat_entry, block_number, sector_in_block, sector_count):
+    """Returns the contents of sectors in a PAYLOAD_BLOCK_ZERO block
+
+    Args:
+      bat_entry (PayloadBlockBATEntry): the BAT entry for the block
+      block_number (int): the block containing the sectors
+      sector_in_block (int): the first sector to read within the block
+      sector_count (int): the number of sectors to read
+
+    Returns:
+      bytes: sector_size*sector_count*b'\x00'
+    """
+    return self._GetZeroSectors(sector_count)
+
+  def _ReadPresentSectors(  #pylint: disable=unused-argument
+      self, bat_entry, block_number, sector_in_block, sector_count):
+    """Returns the contents of sectors in a block stored in this disk
+
+    Args:
+      bat_entry (PayloadBlockBATEntry): the BAT entry for the block
+      block_number (int): the block containing the sectors
+      sector_in_block (int): the first sector to read within the block
+      sector_count (int): the number of sectors to read
+
+    Returns:
+      bytes|memoryview: the sectors contents
+    """
+    return self._ReadSectorBytes(bat_entry, sector_in_block, sector_count)
+
+  def _ReadPartiallyPresentSectors(
+      self, bat_entry, block_number, sector_in_block, sector_count):
+    """Returns the contents of sectors in a PAYLOAD_BLOCK_PARTIALLY_PRESENT
+    block.
+
+    Args:
+      bat_entry (PayloadBlockBATEntry): the BAT entry for the block
+      block_number (int): the block containing the sectors
+      sector_in_block (int): the first sector to read within the block
+      sector_count (int): the number of sectors to read
+
+    Returns:
+      bytearray: the sectors contents
+    """
+    sector_size = self.disk_params.logical_sector_size
+    block_first_sector = block_number*self.sectors_per_block
+    sector_bitmap = self._GetSectorBitmapForBlock(block_number)
+    end_in_block = sector_in_block + sector_count
+    # Copy each run of sectors present in this disk, or in the parent disk,
+    # at once, straight into its place in the result.
+    sectors = bytearray(sector_size*sector_count)
+    sectors_view = memoryview(sectors)
+    # The parent's sectors are read once, on the first run missing from this
+    # disk, rather than once per run.
+    parent_sectors = None
+    # A bitmap can have a run for every sector, so the loop only uses locals.
+    find_run_end = sector_bitmap.index
+    vhdx_view = self._vhdx_view
+    block_offset = bat_entry.offset
+    run_start = sector_in_block
+    while run_start < end_in_block:
+      present = sector_bitmap[run_start]
+      try:
+        run_end = find_run_end(not present, run_start, end_in_block)
+      except ValueError:
+        run_end = end_in_block
+      run_start_offset = (run_start - sector_in_block)*sector_size
+      run_end_offset = (run_end - sector_in_block)*sector_size
+      if present:
+        run_offset = block_offset + run_start*sector_size
+        sectors_view[run_start_offset:run_end_offset] = vhdx_view[
+            run_offset:run_offset + run_end_offset - run_start_offset]
       else:
-        sector = self.parent_disk.ReadSector(sector)
+        if parent_sectors is None:
+          parent_sectors = memoryview(self.parent_disk.ReadSectors(
+              block_first_sector + sector_in_block, sector_count))
+        sectors_view[run_start_offset:run_end_offset] = parent_sectors[
+            run_start_offset:run_end_offset]
+      run_start = run_end
+    return sectors
+
+  def _GetZeroSectors(self, sector_count):
+    """Returns the contents of zeroed sectors
 
-    return sector
+    Args:
+      sector_count (int): the number of sectors
+
+    Returns:
+      bytes: sector_size*sector_count*b'\x00'
+    """
+    if sector_count == 1:
+      return self._zero_sector
+    if len(self._zero_block) == (
+        sector_count*self.disk_params.logical_sector_size):
+      return self._zero_block
+    return bytes(sector_count*self.disk_params.logical_sector_size)
 
-  def _ReadSectorBytes(self, bat_entry, sector_in_block):
-    """Returns sector contents if an offset is present in the BAT entry
-    otherwise return a sector's worth of zero bytes.
+  def _ReadSectorBytes(self, bat_entry, sector_in_block, sector_count=1):
+    """Returns sectors contents if an offset is present in the BAT entry
+    otherwise return the sectors' worth of zero bytes.
 
     Args:
       bat_entry (PayloadBlockBATEntry): the BAT entry for the block containing
-        the target sector
-      sector_in_block (int): the target sector within the block
+        the target sectors
+      sector_in_block (int): the first target sector within the block
+      sector_count (int): the number of sectors to read
 
     Returns:
-      bytes: either the sector contents or sector_size*b'\x00 if no offset was
-        given in the BAT entry
+      bytes|memoryview: either the sectors contents or
+        sector_size*sector_count*b'\x00 if no offset was given in the BAT
+        entry
     """
+    sectors_size = self.disk_params.logical_sector_size*sector_count
     if bat_entry.offset:
-      self.vhdx_fd.seek(bat_entry.offset +
-        sector_in_block*self.disk_params.logical_sector_size)
-      sector = self.vhdx_fd.read(self.disk_params.logical_sector_size)
+      sectors = self._ReadAt(bat_entry.offset +
+        sector_in_block*self.disk_params.logical_sector_size, sectors_size)
     else:
-      sector = b'\x00'*self.disk_params.logical_sector_size
-    return sector
+      sectors = self._GetZeroSectors(sector_count)
+    return sectors
+
+  # The methods reading sectors from a block, indexed by the state of the
+  # block's payload BAT entry. Invalid states are rejected when the BAT is
+  # parsed.
+  _SECTORS_READERS = (
+      _ReadNotPresentSectors,  # PAYLOAD_BLOCK_NOT_PRESENT
+      _ReadPresentSectors,  # PAYLOAD_BLOCK_UNDEFINED
+      _ReadZeroSectors,  # PAYLOAD_BLOCK_ZERO
+      _ReadPresentSectors,  # PAYLOAD_BLOCK_UNMAPPED
+      None,
+      None,
+      _ReadPresentSectors,  # PAYLOAD_BLOCK_FULLY_PRESENT
+      _ReadPartiallyPresentSectors  # PAYLOAD_BLOCK_PARTIALLY_PRESENT
+  )
 
 
 class MergeVHDXTool:
   """Main class for the MergeVHDXTool tool."""
 
+  # Number of threads reading blocks from the disks while the merged image is
+  # written.
+  MAX_READING_THREADS = 8
+
+  # Maximum number of blocks read ahead of the one being written.
+  MAX_PENDING_BLOCKS = 16
+
   def __init__(self):
     """Initializes the MergeVHDXTool class."""
     self._argument_parser = None
@@ -560,6 +846,10 @@ class MergeVHDXTool:
     argument_parser.add_argument(
         '-y', '--yes', dest='yes', action='store_true', default=False,
         help='Skip confirmations.')
+    argument_parser.add_argument(
+        '-s', '--sparse', dest='sparse', action='store_true', default=False,
+        help=('Leave blocks only containing zeros as holes in the output '
+              'image. Only use this when writing to a regular file.'))
 
   def ParseArguments(self):
     """Parses the command line arguments.
@@ -594,6 +884,118 @@ class MergeVHDXTool:
     handler.setFormatter(formatter)
     logger.addHandler(handler)
 
+  def _ReadBlocks(self, disk):
+    """Reads the contents of a disk, merged with its parents, block by block.
+
+    Blocks are read by a pool of threads, at most MAX_PENDING_BLOCKS ahead of
+    the block being consumed, which bounds the memory used to the size of
+    that many blocks.
+
+    Args:
+      disk (VHDXDisk): the disk to read.
+
+    Yields:
+      bytes|bytearray|memoryview: the contents of each block, in order.
+    """
+    sector_count = disk.disk_params.sector_count
+    sectors_per_block = disk.sectors_per_block
+
+    def _ReadBlock(sector):
+      return disk.ReadSectors(
+          sector, min(sectors_per_block, sector_count - sector))
+
+    pending_blocks = deque()
+    with concurrent.futures.ThreadPoolExecutor(
+        max_workers=self.MAX_READING_THREADS) as executor:
+      for sector in range(0, sector_count, sectors_per_block):
+        if len(pending_blocks) == self.MAX_PENDING_BLOCKS:
+          yield pending_blocks.popleft().result()
+        pending_blocks.append(executor.submit(_ReadBlock, sector))
+      while pending_blocks:
+        yield pending_blocks.popleft().result()
+
+  def _IsRegularFile(self, out_image_fd):
+    """Checks whether a file object is backed by a regular file.
+
+    Args:
+      out_image_fd (file): the file object to check.
+
+    Returns:
+      bool: True if the file is a regular file.
+    """
+    try:
+      return (out_image_fd.seekable() and
+              stat.S_ISREG(os.fstat(out_image_fd.fileno()).st_mode))
+    except (OSError, ValueError):
+      return False
+
+  def _CopyFileRange(self, in_fd, in_offset, out_image_fd, size):
+    """Copies bytes from a file to the current position of another one.
+
+    The copy is done by the kernel with os.copy_file_range, without reading
+    the bytes in, and may even share them on filesystems supporting reflinks.
+
+    Args:
+      in_fd (file): the file to copy from.
+      in_offset (int): the offset to copy from.
+      out_image_fd (file): the file to copy to.
+      size (int): the number of bytes to copy.
+
+    Returns:
+      int: the number of bytes copied, less than size if the kernel or the
+        files don't support the copy.
+    """
+    out_image_fd.flush()
+    out_offset = out_image_fd.tell()
+    copied = 0
+    try:
+      while copied < size:
+        count = os.copy_file_range(
+            in_fd.fileno(), out_image_fd.fileno(), size - copied,
+            in_offset + copied, out_offset + copied)
+        if not count:
+          break
+        copied += count
+    except OSError:
+      pass
+    out_image_fd.seek(out_offset + copied)
+    return copied
+
+  def _WriteMergedImage(self, disk, out_image_fd, sparse=False):
+    """Writes the contents of a disk, merged with its parents, to a file.
+
+    Args:
+      disk (VHDXDisk): the disk to write.
+      out_image_fd (file): the file to write the disk contents to.
+      sparse (bool): whether to seek over blocks only containing zeros
+        instead of writing them, leaving holes in the file.
+    """
+    zero_block = bytes(disk.disk_params.block_size)
+    # Kernel copies need an offset in the output, so only regular files get
+    # them, pipes and other streams are written to.
+    copy_blocks = (
+        hasattr(os, 'copy_file_range') and self._IsRegularFile(out_image_fd))
+    for block_number, block in enumerate(self._ReadBlocks(disk)):
+      # startswith() compares any buffer with memcmp, the last block may be
+      # shorter than the others.
+      if sparse and zero_block.startswith(block):
+        out_image_fd.seek(len(block), os.SEEK_CUR)
+        continue
+      location = copy_blocks and disk.LocateBlock(block_number)
+      if location:
+        block_disk, block_offset = location
+        copied = self._CopyFileRange(
+            block_disk.vhdx_fd, block_offset, out_image_fd, len(block))
+        if copied < len(block):
+          # The files don't support copying, write the blocks from now on.
+          copy_blocks = False
+          out_image_fd.write(block[copied:])
+      else:
+        out_image_fd.write(block)
+    if sparse:
+      # Sets the size of the file if it ends with a hole.
+      out_image_fd.truncate()
+
   def Main(self):
     """The main method for the MergeVHDXTool class.
 
@@ -615,8 +1017,8 @@ class MergeVHDXTool:
         if confirm.lower() != 'y':
           sys.exit()
 
-      for sector in range(0, child_disk.disk_params.sector_count):
-        out_image_fd.write(child_disk.ReadSector(sector))
+      self._WriteMergedImage(
+          child_disk, out_image_fd, sparse=options.sparse)
 
 
 if __name__ == '__main__':
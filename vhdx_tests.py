@@ -14,6 +14,8 @@
 # limitations under the License.
 """Tests for the vhdx.py tool."""
 
+import concurrent.futures
+import functools
 import os
 import sys
 import shutil
@@ -24,6 +26,7 @@ import tempfile
 import hashlib
 
 from tools.merge_vhdx import BATParams
+from tools.merge_vhdx import DiskParams
 from tools.merge_vhdx import SectorBitmapBATEntry
 from tools.merge_vhdx import PayloadBlockBATEntry
 from tools.merge_vhdx import BlockAllocationTable
@@ -32,6 +35,36 @@ from tools.merge_vhdx import MergeVHDXTool
 
 # pylint: disable=protected-access
 
+VHDX_FILES_PATH = os.path.join('test_data', 'vhdx_files')
+
+
+def _ExtractVHDXFiles():
+  """Extracts the test VHDX files, if they aren't already."""
+  if not os.path.isdir(VHDX_FILES_PATH):
+    vhdx_tar = os.path.join('test_data', 'vhdx_files.tgz')
+    with tarfile.open(vhdx_tar, 'r:gz') as tar:
+      tar.extractall('test_data')
+
+
+@functools.lru_cache(maxsize=None)
+def _OpenVHDXDisks():
+  """Returns the test disks, parsed once for all the tests.
+
+  Returns:
+    tuple(VHDXDisk, VHDXDisk): the base disk and the differencing disk.
+  """
+  _ExtractVHDXFiles()
+  base_disk = VHDXDisk(os.path.join(VHDX_FILES_PATH, 'base.vhdx'))
+  diff_disk = VHDXDisk(
+      os.path.join(VHDX_FILES_PATH, 'diff.vhdx'), parent_disk=base_disk)
+  return base_disk, diff_disk
+
+
+def tearDownModule():  #pylint: disable=invalid-name
+  """Removes the extracted test VHDX files."""
+  shutil.rmtree(VHDX_FILES_PATH, ignore_errors=True)
+
+
 class BlockAllocationTableEntryTests(unittest.TestCase):
   """Tests for the BlockAllocationTableEntry subclasses"""
 
@@ -47,6 +80,8 @@ class BlockAllocationTableEntryTests(unittest.TestCase):
     """Tests the appropriate error is raised for an invalid state"""
     with self.assertRaises(ValueError):
       _ = SectorBitmapBATEntry(b'\x05\x00\x10\x01\x00\x00\x00\x00')
+    with self.assertRaises(ValueError):
+      _ = SectorBitmapBATEntry(b'\x07\x00\x10\x01\x00\x00\x00\x00')
 
   def testPayloadBlockParse(self):
     """Tests PayloadBlockBATEntry parsing"""
@@ -65,16 +100,19 @@ class BlockAllocationTableEntryTests(unittest.TestCase):
 class BlockAllocationTableTests(unittest.TestCase):
   """Tests for the BlockAllocationTable class"""
 
-  def setUp(self):
+  @classmethod
+  def setUpClass(cls):
     bat_bytes = b'\x07\x00\x10\x01\x00\x00\x00\x00'*10 +\
         b'\x06\x00\x10\x01\x00\x00\x00\x00'
     bat_params = BATParams(10, 11, 10, 1)
-    self.bat_table = BlockAllocationTable(bat_bytes, bat_params)
+    cls.bat_table = BlockAllocationTable(bat_bytes, bat_params)
 
   def testParseBATBytes(self):
     """Test that the correct number of BAT entries are parsed"""
-    self.assertEqual(len(self.bat_table.payload_entries), 10)
-    self.assertEqual(len(self.bat_table.sector_bitmap_entries), 1)
+    self.assertEqual(len(self.bat_table.payload_states), 10)
+    self.assertEqual(len(self.bat_table.payload_offsets), 10)
+    self.assertEqual(len(self.bat_table.sector_bitmap_states), 1)
+    self.assertEqual(len(self.bat_table.sector_bitmap_offsets), 1)
 
   def testParseBATBytesError(self):
     "Tests that a ValueError is raised on unexpected results"
@@ -84,6 +122,28 @@ class BlockAllocationTableTests(unittest.TestCase):
     with self.assertRaises(ValueError):
       self.bat_table = BlockAllocationTable(bat_bytes, bat_params)
 
+  def testParseBATBytesStateInvalid(self):
+    """Tests that a ValueError is raised for an invalid entry state"""
+    # The sector bitmap entry has the PAYLOAD_BLOCK_PARTIALLY_PRESENT state.
+    bat_bytes = b'\x07\x00\x10\x01\x00\x00\x00\x00'*11
+    bat_params = BATParams(10, 11, 10, 1)
+    with self.assertRaisesRegex(
+        ValueError, 'Invalid state 7 for sector bitmap entry 0'):
+      self.bat_table = BlockAllocationTable(bat_bytes, bat_params)
+
+  def testParseBATBytesFirstStateInvalid(self):
+    """Tests that the first entry with an invalid state is reported"""
+    # Entry 0 has state 5 and entry 3 the lower invalid state 4.
+    bat_bytes = (b'\x05\x00\x10\x01\x00\x00\x00\x00' +
+        b'\x07\x00\x10\x01\x00\x00\x00\x00'*2 +
+        b'\x04\x00\x10\x01\x00\x00\x00\x00' +
+        b'\x07\x00\x10\x01\x00\x00\x00\x00'*6 +
+        b'\x06\x00\x10\x01\x00\x00\x00\x00')
+    bat_params = BATParams(10, 11, 10, 1)
+    with self.assertRaisesRegex(
+        ValueError, 'Invalid state 5 for payload block entry 0'):
+      _ = BlockAllocationTable(bat_bytes, bat_params)
+
   def testGetPayloadBatEntry(self):
     """Test GetPayloadBatEntry"""
     self.assertEqual('PAYLOAD_BLOCK_PARTIALLY_PRESENT',
@@ -97,22 +157,9 @@ class BlockAllocationTableTests(unittest.TestCase):
 class VHDXDiskTests(unittest.TestCase):
   """Tests for the VHDXDisk class"""
 
-  @classmethod
-  def tearDownClass(cls):
-    shutil.rmtree(cls.vhdx_files_path)
-
   @classmethod
   def setUpClass(cls):
-    cls.vhdx_files_path = os.path.join('test_data', 'vhdx_files')
-    if not os.path.isdir(cls.vhdx_files_path):
-      vhdx_tar = os.path.join('test_data', 'vhdx_files.tgz')
-      tar = tarfile.open(vhdx_tar, 'r:gz')
-      tar.extractall('test_data')
-      tar.close()
-    base_path = os.path.join(cls.vhdx_files_path, 'base.vhdx')
-    diff_path = os.path.join(cls.vhdx_files_path, 'diff.vhdx')
-    cls.base_disk = VHDXDisk(base_path)
-    cls.diff_disk = VHDXDisk(diff_path, parent_disk=cls.base_disk)
+    cls.base_disk, cls.diff_disk = _OpenVHDXDisks()
 
   def testParseDiskParams(self):
     """Tests _ParseDiskParams and associated functions"""
@@ -129,6 +176,20 @@ class VHDXDiskTests(unittest.TestCase):
     self.assertEqual(4, self.base_disk.bat_params.payload_entries)
     self.assertEqual(1, self.base_disk.bat_params.sector_bitmap_entries)
 
+  def testCalculateBATParamsLargeDisk(self):
+    """Tests _CalculateBATParams with a size too large for float division"""
+    disk_params = DiskParams(
+        block_size=32*1024**2, logical_sector_size=512,
+        virtual_disk_size=2**62 + 512, has_parent=True,
+        sector_count=(2**62 + 512) // 512)
+    with unittest.mock.patch.object(
+        self.diff_disk, 'disk_params', disk_params):
+      bat_params = self.diff_disk._CalculateBATParams()
+    self.assertEqual(128, bat_params.chunk_ratio)
+    self.assertEqual(2**37 + 1, bat_params.payload_entries)
+    self.assertEqual(2**30 + 1, bat_params.sector_bitmap_entries)
+    self.assertEqual((2**30 + 1)*129, bat_params.total_entries)
+
   def testConvertBytesToBitmap(self):
     """Tests for the _ConvertBytesToBitmap method"""
     sb_bytes = b'\xf0\x0f'
@@ -141,6 +202,15 @@ class VHDXDiskTests(unittest.TestCase):
     result = self.diff_disk._GetSectorBitmapForBlock(1)[:88]
     self.assertEqual(expected, result)
 
+  def testGetSectorBitmapForBlockCached(self):
+    """Tests that _GetSectorBitmapForBlock reuses the last decoded bitmap"""
+    sector_bitmap = self.diff_disk._GetSectorBitmapForBlock(1)
+    with unittest.mock.patch.object(
+        self.diff_disk, '_ConvertBytesToBitmap') as mock_convert:
+      self.assertIs(
+          sector_bitmap, self.diff_disk._GetSectorBitmapForBlock(1))
+      mock_convert.assert_not_called()
+
   def testReadSectorBaseDisk(self):
     """Test for the _GetSectorBitmapForBlock method for a base disk"""
     expected = b'\x33\xc0\x8e\xd0\xbc\x00\x7c\x8e'
@@ -153,6 +223,39 @@ class VHDXDiskTests(unittest.TestCase):
     result = self.diff_disk.ReadSector(0)[:8]
     self.assertEqual(expected, result)
 
+  def testReadSectorsDiffDisk(self):
+    """Tests that ReadSectors matches ReadSector across a partial block"""
+    # Block 1 is partially present, and its first sectors come from the
+    # parent disk.
+    first_sector = 2048 - 8
+    expected = b''.join(
+        self.diff_disk.ReadSector(sector)
+        for sector in range(first_sector, first_sector + 120))
+    self.assertEqual(expected, self.diff_disk.ReadSectors(first_sector, 120))
+
+  def testLocateBlock(self):
+    """Tests LocateBlock"""
+    self.assertEqual((self.base_disk, 4194304), self.base_disk.LocateBlock(0))
+    # Partially present in the differencing disk.
+    self.assertIsNone(self.diff_disk.LocateBlock(0))
+    # Not present in either disk.
+    self.assertIsNone(self.diff_disk.LocateBlock(3))
+
+  def testLocateBlockInParent(self):
+    """Tests LocateBlock for a block only present in the parent disk"""
+    not_present_entry = PayloadBlockBATEntry(b'\x00'*8)
+    with unittest.mock.patch.object(
+        self.diff_disk.bat_table, 'GetPayloadBATEntry',
+        return_value=not_present_entry):
+      self.assertEqual(
+          (self.base_disk, 4194304), self.diff_disk.LocateBlock(0))
+      # The parent's block 0 doesn't match the child's with another size.
+      disk_params = self.base_disk.disk_params._replace(
+          block_size=2*self.base_disk.disk_params.block_size)
+      with unittest.mock.patch.object(
+          self.base_disk, 'disk_params', disk_params):
+        self.assertIsNone(self.diff_disk.LocateBlock(0))
+
   def testReadSectorBytes(self):
     """Tests for the _ReadSectorBytes method"""
     expected = b'\x33\xc0\x8e\xd0\xbc\x00\x7c\x8e'
@@ -165,20 +268,50 @@ class VHDXDiskTests(unittest.TestCase):
 class MergeVHDXToolTests(unittest.TestCase):
   """Tests for the MergeVHDXTool class"""
 
-  @classmethod
-  def tearDownClass(cls):
-    shutil.rmtree(cls.vhdx_files_path)
-
   @classmethod
   def setUpClass(cls):
-    cls.vhdx_files_path = os.path.join('test_data', 'vhdx_files')
-    if not os.path.isdir(cls.vhdx_files_path):
-      vhdx_tar = os.path.join('test_data', 'vhdx_files.tgz')
-      tar = tarfile.open(vhdx_tar, 'r:gz')
-      tar.extractall('test_data')
-      tar.close()
-    cls.base_path = os.path.join(cls.vhdx_files_path, 'base.vhdx')
-    cls.diff_path = os.path.join(cls.vhdx_files_path, 'diff.vhdx')
+    cls.base_disk, cls.diff_disk = _OpenVHDXDisks()
+    cls.base_path = cls.base_disk.vhdx_name
+    cls.diff_path = cls.diff_disk.vhdx_name
+
+  def testReadBlocks(self):
+    """Tests that _ReadBlocks yields every block of the disk in order"""
+    diff_disk = self.diff_disk
+    tool_object = MergeVHDXTool()
+    with unittest.mock.patch.object(MergeVHDXTool, 'MAX_PENDING_BLOCKS', 2):
+      blocks = list(tool_object._ReadBlocks(diff_disk))
+    self.assertEqual(4, len(blocks))
+    self.assertEqual(
+        diff_disk.ReadSectors(0, diff_disk.disk_params.sector_count),
+        b''.join(blocks))
+
+  def testWriteMergedImage(self):
+    """Tests _WriteMergedImage with blocks fully present in the disk"""
+    base_disk = self.base_disk
+    tool_object = MergeVHDXTool()
+    with tempfile.TemporaryFile() as out_image_fd:
+      tool_object._WriteMergedImage(base_disk, out_image_fd)
+      out_image_fd.seek(0)
+      self.assertEqual(
+          base_disk.ReadSectors(0, base_disk.disk_params.sector_count),
+          out_image_fd.read())
+
+  def testWriteMergedImageToPipe(self):
+    """Tests _WriteMergedImage with an output that isn't seekable"""
+    base_disk = self.base_disk
+    tool_object = MergeVHDXTool()
+    read_fd, write_fd = os.pipe()
+    with open(read_fd, 'rb') as pipe_in, open(write_fd, 'wb') as pipe_out:
+      with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
+        # The pipe's buffer is smaller than the image, so read it meanwhile.
+        read_future = executor.submit(pipe_in.read)
+        try:
+          tool_object._WriteMergedImage(base_disk, pipe_out)
+        finally:
+          pipe_out.close()
+        self.assertEqual(
+            base_disk.ReadSectors(0, base_disk.disk_params.sector_count),
+            read_future.result())
 
   def testMain(self):
     """Tests the main method of MergeVHDXTool"""
@@ -191,13 +324,30 @@ class MergeVHDXToolTests(unittest.TestCase):
         out_file, '-y']
 
     tool_object.Main()
-    result_hash = hashlib.sha256()
     with open(out_file, "rb") as fd:
-      result_hash.update(fd.read())
+      result_hash = hashlib.file_digest(fd, 'sha256')
     os.remove(out_file)
 
     self.assertEqual(expected_hash, result_hash.hexdigest())
 
+  def testMainSparse(self):
+    """Tests the main method of MergeVHDXTool with a sparse output image"""
+    expected_hash = (
+        'a9717baccc52410c8c1ecb3ad096ccdfb842b4a48068b0d86f4191efa3985693')
+    tool_object = MergeVHDXTool()
+    out_file = tempfile.mktemp()
+    prog = sys.argv[0]
+    sys.argv = [prog, '-p', self.base_path, '-c', self.diff_path, '-o',
+        out_file, '-y', '--sparse']
+
+    tool_object.Main()
+    with open(out_file, "rb") as fd:
+      result_hash = hashlib.file_digest(fd, 'sha256')
+    out_file_size = os.path.getsize(out_file)
+    os.remove(out_file)
+
+    self.assertEqual(4*1024**2, out_file_size)
+    self.assertEqual(expected_hash, result_hash.hexdigest())
 
 if __name__ == '__main__':
   unittest.main()